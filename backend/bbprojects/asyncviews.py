@@ -0,0 +1,139 @@
+import logging
+from functools import update_wrapper
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .models import Snippet
+from .concurrency import gather_reads
+from .feeds import parse_feed_params, aget_activity_feed
+from . import views
+
+logger = logging.getLogger(__name__)
+
+class AsyncViewSetMixin:
+    """
+    Serve a DRF viewset as a native async Django view.
+
+    Handlers written as ``async def`` are awaited directly; every other handler
+    (create, update, destroy, ...) still runs synchronously in a thread, so
+    write paths keep their existing behaviour.
+    """
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        update_wrapper(async_view, view)
+        return csrf_exempt(async_view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self, queryset=None):
+        if queryset is None:
+            queryset = self.get_queryset()
+        queryset = self.filter_queryset(queryset)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError):
+            raise Http404
+
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page, data = await sync_to_async(self.list_page)(queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        return Response(await sync_to_async(lambda: serializer.data)())
+
+class UserViewSet(AsyncViewSetMixin, views.UserViewSet):
+
+    @action(detail=False, methods=['get', 'patch'], permission_classes=[permissions.IsAuthenticated])
+    async def me(self, request):
+        if request.method == 'GET':
+            return Response(self.get_serializer(request.user).data)
+        return await sync_to_async(super().me)(request)
+
+    @action(detail=False, methods=['get'], url_path='me/stats', permission_classes=[permissions.IsAuthenticated])
+    async def stats(self, request):
+        user = request.user
+        try:
+            snippets_count, collections_count, likes_received, likes_given = await gather_reads(
+                lambda: user.snippets.count(),
+                lambda: user.collections.count(),
+                lambda: Snippet.likes.through.objects.filter(snippet__owner=user).count(),
+                lambda: user.liked_snippets.count(),
+            )
+        except Exception:
+            logger.exception("Failed to get stats for user %s", user.pk)
+            return Response(
+                {"error": "Failed to get user stats"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response({
+            'snippets_count': snippets_count,
+            'collections_count': collections_count,
+            'likes_received': likes_received,
+            'likes_given': likes_given,
+        })
+
+    @action(detail=False, methods=['get'], url_path='me/activity', permission_classes=[permissions.IsAuthenticated])
+    async def activity(self, request):
+        kinds, limit = parse_feed_params(request.query_params)
+        try:
+            return Response(await aget_activity_feed(request, kinds, limit))
+        except Exception:
+            logger.exception("Failed to get activity for user %s", request.user.pk)
+            return Response(
+                {"error": "Failed to get user activity"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class SnippetViewSet(AsyncViewSetMixin, views.SnippetViewSet):
+    pass
+
+class CollectionViewSet(AsyncViewSetMixin, views.CollectionViewSet):
+    pass
@@ -0,0 +1,277 @@
+import abc
+import json
+import platform
+import random
+import subprocess
+import time
+from contextlib import ExitStack
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .instrumentation import QueryTracker
+from .models import User, CodeBlob, Snippet, Collection, SearchSuggestion
+from .suggest import SOURCES, source_rows
+from .utils import percentile
+
+USERNAME_PREFIX = 'bench_'
+
+SEED_DEFAULTS = {
+    'users': 200,
+    'snippets_per_user': 10,
+    'likes_per_snippet': 8,
+    'collections_per_user': 2,
+    'snippets_per_collection': 15,
+    'large_collection_size': 500,
+    'code_size': 800,
+}
+
+def seed(users, snippets_per_user, likes_per_snippet, collections_per_user,
+         snippets_per_collection, large_collection_size, code_size,
+         random_seed=0, batch_size=2000):
+    """
+    Bulk-insert a reproducible dataset of benchmark users, snippets, likes and
+    collections. The first benchmark user also owns one collection with
+    ``large_collection_size`` members for the collection-detail scenario.
+    """
+    rng = random.Random(random_seed)
+    languages = [choice for choice, _ in Snippet.LANGUAGE_CHOICES]
+    offset = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+
+    User.objects.bulk_create([
+        User(username=f'{USERNAME_PREFIX}{offset + i}', email=f'{USERNAME_PREFIX}{offset + i}@example.com',
+             password='!', bio='Benchmark user', is_public=rng.random() < 0.9)
+        for i in range(users)
+    ], batch_size=batch_size)
+    user_ids = list(
+        User.objects.filter(username__startswith=USERNAME_PREFIX)
+        .order_by('id').values_list('id', flat=True)[offset:]
+    )
+
+    code = ''.join(rng.choice('abcdefghij(){}=;\n    ') for _ in range(code_size))
+    code_blob = CodeBlob.objects.store(code)
+    Snippet.objects.bulk_create([
+        Snippet(title=f'Snippet {owner_id}-{i}', code_blob=code_blob,
+                language=rng.choice(languages), description='Generated for benchmarks',
+                owner_id=owner_id, is_public=rng.random() < 0.9)
+        for owner_id in user_ids for i in range(snippets_per_user)
+    ], batch_size=batch_size)
+    snippet_ids = list(
+        Snippet.objects.filter(owner_id__in=user_ids).order_by('id').values_list('id', flat=True)
+    )
+
+    Like = Snippet.likes.through
+    Like.objects.bulk_create([
+        Like(snippet_id=snippet_id, user_id=user_id)
+        for snippet_id in snippet_ids
+        for user_id in rng.sample(user_ids, min(likes_per_snippet, len(user_ids)))
+    ], batch_size=batch_size)
+    # bulk_create sends no m2m_changed, so the stored counters are set here
+    Snippet.objects.filter(pk__in=snippet_ids).refresh_likes_count()
+
+    Collection.objects.bulk_create([
+        Collection(name=f'Collection {owner_id}-{i}', description='Generated for benchmarks',
+                   owner_id=owner_id, is_public=rng.random() < 0.9)
+        for owner_id in user_ids for i in range(collections_per_user)
+    ] + [
+        Collection(name='Large collection', owner_id=user_ids[0], is_public=True)
+    ], batch_size=batch_size)
+    collections = list(
+        Collection.objects.filter(owner_id__in=user_ids).order_by('id').values_list('id', 'name')
+    )
+
+    Member = Collection.snippets.through
+    Member.objects.bulk_create([
+        Member(collection_id=collection_id, snippet_id=snippet_id)
+        for collection_id, name in collections
+        for snippet_id in rng.sample(
+            snippet_ids,
+            min(large_collection_size if name == 'Large collection' else snippets_per_collection,
+                len(snippet_ids)),
+        )
+    ], batch_size=batch_size)
+    Collection.objects.filter(pk__in=[c[0] for c in collections]).refresh_snippet_count()
+    # bulk_create sends no post_save either; index the whole (throwaway) database
+    for kind, (label, *_) in SOURCES.items():
+        for rows in source_rows(kind, apps.get_model(label), batch_size):
+            SearchSuggestion.objects.index(rows)
+
+    return {
+        'users': len(user_ids),
+        'snippets': len(snippet_ids),
+        'likes': Like.objects.filter(snippet_id__in=snippet_ids).count(),
+        'collections': len(collections),
+        'memberships': Member.objects.filter(collection_id__in=[c[0] for c in collections]).count(),
+    }
+
+class ScenarioError(Exception):
+    """The database lacks the rows a scenario needs."""
+
+class Scenario(abc.ABC):
+    """A scripted sequence of requests; ``requests()`` yields (method, path, user)."""
+
+    name = None
+
+    def __init__(self, iterations):
+        self.iterations = iterations
+        self.users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+        if not self.users:
+            raise ScenarioError(f'{self.name}: no {USERNAME_PREFIX}* users, run seed_data first.')
+
+    @abc.abstractmethod
+    def requests(self):
+        """Yield ``(method, path, user)``; ``user`` is None for anonymous requests."""
+
+class AnonymousFeed(Scenario):
+    name = 'anonymous_feed'
+
+    def requests(self):
+        for i in range(self.iterations):
+            path = '/api/snippets/' if i % 2 == 0 else '/api/collections/'
+            yield 'get', path, None
+
+class AuthenticatedFeed(Scenario):
+    name = 'authenticated_feed'
+
+    def requests(self):
+        for i in range(self.iterations):
+            yield 'get', '/api/snippets/?page_size=20', self.users[i % len(self.users)]
+
+class SnippetPage(Scenario):
+    name = 'snippet_page'
+
+    def requests(self):
+        for _ in range(self.iterations):
+            yield 'get', '/api/snippets/?page_size=100', None
+
+class LikeStorm(Scenario):
+    name = 'like_storm'
+
+    def requests(self):
+        hot = list(Snippet.objects.filter(is_public=True).order_by('id').values_list('id', flat=True)[:5])
+        if not hot:
+            raise ScenarioError(f'{self.name}: no public snippets to like, run seed_data first.')
+        for i in range(self.iterations):
+            yield 'post', f'/api/snippets/{hot[i % len(hot)]}/like/', self.users[i % len(self.users)]
+
+class LargeCollectionDetail(Scenario):
+    name = 'collection_detail'
+
+    def requests(self):
+        large = Collection.objects.filter(name='Large collection').order_by('-id').first()
+        if large is None:
+            raise ScenarioError(f'{self.name}: no "Large collection", run seed_data first.')
+        for _ in range(self.iterations):
+            yield 'get', f'/api/collections/{large.pk}/', None
+
+class SearchSuggest(Scenario):
+    name = 'search_suggest'
+
+    def requests(self):
+        # Keystrokes of a few queries, so most prefixes repeat and hit the cache
+        prefixes = [query[:size] for query in ('bench', 'snippet', 'collection') for size in range(1, 6)]
+        for i in range(self.iterations):
+            user = self.users[i % len(self.users)] if i % 2 else None
+            yield 'get', f'/api/search/suggest?q={prefixes[i % len(prefixes)]}', user
+
+class StatsAndActivity(Scenario):
+    name = 'stats_activity'
+
+    def requests(self):
+        for i in range(self.iterations):
+            path = '/api/users/me/stats/' if i % 2 == 0 else '/api/users/me/activity/'
+            yield 'get', path, self.users[(i // 2) % len(self.users)]
+
+SCENARIOS = {s.name: s for s in (
+    AnonymousFeed, AuthenticatedFeed, SnippetPage, LikeStorm, LargeCollectionDetail, SearchSuggest,
+    StatsAndActivity,
+)}
+
+def run_scenario(scenario_class, iterations):
+    """Run one scenario in-process and summarise latency and queries per request."""
+    scenario = scenario_class(iterations)
+    client = Client(HTTP_HOST='localhost')
+    tokens = {}
+    latencies, queries, statuses = [], [], {}
+
+    cache.clear()
+    started = time.perf_counter()
+    for method, path, user in scenario.requests():
+        headers = {}
+        if user is not None:
+            if user.pk not in tokens:
+                tokens[user.pk] = str(RefreshToken.for_user(user).access_token)
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {tokens[user.pk]}'
+        with ExitStack() as stack:
+            tracker = QueryTracker().track(stack)
+            request_started = time.perf_counter()
+            response = getattr(client, method)(path, **headers)
+            latencies.append((time.perf_counter() - request_started) * 1000)
+        queries.append(tracker.count)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries),
+        },
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+    }
+
+def compare(baseline, current):
+    """Relative change of the headline numbers of every scenario in both reports."""
+    changes = {}
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            'p50_ms': _change(before['latency_ms']['p50'], result['latency_ms']['p50']),
+            'p95_ms': _change(before['latency_ms']['p95'], result['latency_ms']['p95']),
+            'throughput_rps': _change(before['throughput_rps'], result['throughput_rps']),
+            'queries_per_request': _change(
+                before['queries_per_request']['mean'], result['queries_per_request']['mean']
+            ),
+        }
+    return changes
+
+def _change(before, after):
+    return {
+        'before': before,
+        'after': after,
+        'change_pct': round((after - before) / before * 100, 1) if before else None,
+    }
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,35 @@
+# Encoding of the code bodies kept in the content-addressed CodeBlob table.
+import hashlib
+import zlib
+
+from django.conf import settings
+
+BLOB_DEFAULTS = {
+    # Bodies smaller than this are stored as plain UTF-8
+    'COMPRESS_MIN_SIZE': 512,
+    'COMPRESS_LEVEL': 6,
+    # Unreferenced blobs younger than this are kept: a snippet save may be
+    # about to point at one it just stored
+    'PURGE_GRACE_SECONDS': 3600,
+}
+
+def blob_settings():
+    return {**BLOB_DEFAULTS, **getattr(settings, 'CODE_BLOBS', {})}
+
+def encode(text):
+    """
+    ``(digest, data, compressed, size)`` for storing ``text``. The digest (hex
+    SHA-256 of the UTF-8 bytes) is the blob's key, so equal bodies share a row.
+    """
+    conf = blob_settings()
+    raw = text.encode()
+    data, compressed = raw, False
+    if len(raw) >= conf['COMPRESS_MIN_SIZE']:
+        packed = zlib.compress(raw, conf['COMPRESS_LEVEL'])
+        if len(packed) < len(raw):
+            data, compressed = packed, True
+    return hashlib.sha256(raw).hexdigest(), data, compressed, len(raw)
+
+def decode(data, compressed):
+    data = bytes(data)
+    return (zlib.decompress(data) if compressed else data).decode()
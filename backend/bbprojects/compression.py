@@ -0,0 +1,223 @@
+import hashlib
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    # Fast levels: within a few percent of the maximum ratio on JSON pages at
+    # a fraction of the CPU time
+    'LEVELS': {'zstd': 3, 'br': 4, 'gzip': 5},
+    'CONTENT_TYPES': ('application/json', 'text/plain', 'text/csv', 'application/x-ndjson'),
+    # Compressed bodies are cached by content hash for anonymous responses
+    'CACHE': 'default',
+    'CACHE_TIMEOUT': 300,
+    'CACHE_MAX_SIZE': 2 * 1024 * 1024,
+}
+
+def compression_settings():
+    return {**COMPRESSION_DEFAULTS, **getattr(settings, 'RESPONSE_COMPRESSION', {})}
+
+class Gzip:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def chunk(self, compressor, data):
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, compressor):
+        return compressor.flush()
+
+class Brotli(Gzip):
+    name = 'br'
+
+    def compressor(self):
+        return brotli.Compressor(quality=self.level)
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def chunk(self, compressor, data):
+        return compressor.process(data) + compressor.flush()
+
+    def finish(self, compressor):
+        return compressor.finish()
+
+class Zstd(Gzip):
+    name = 'zstd'
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def chunk(self, compressor, data):
+        return compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+def available_encoders(levels):
+    """Encoders this process can use, in order of preference."""
+    encoders = []
+    if zstandard is not None:
+        encoders.append(Zstd(levels['zstd']))
+    if brotli is not None:
+        encoders.append(Brotli(levels['br']))
+    encoders.append(Gzip(levels['gzip']))
+    return encoders
+
+def parse_accept_encoding(header):
+    """``{coding: q}`` for the codings listed in an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+class CompressionMiddleware:
+    """
+    Compress API responses with the best encoding the client accepts (zstd,
+    brotli or gzip, depending on what is installed). Small bodies and
+    non-text content are sent as is; streaming responses are compressed chunk
+    by chunk and flushed so clients still receive data as it is produced.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        conf = compression_settings()
+        if not conf['ENABLED']:
+            raise MiddlewareNotUsed
+        self.conf = conf
+        self.encoders = available_encoders({**COMPRESSION_DEFAULTS['LEVELS'], **conf['LEVELS']})
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        encoder = self.choose_encoder(request, response)
+        if encoder is not None:
+            self.encode(request, response, encoder)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        encoder = self.choose_encoder(request, response)
+        if encoder is None:
+            return response
+        if response.streaming:
+            # Only wraps the iterator; chunks are compressed as they are sent
+            self.encode(request, response, encoder)
+        else:
+            # Compressing, the compressed-page cache and loading a session
+            # user would all block the event loop
+            await sync_to_async(self.encode)(request, response, encoder)
+        return response
+
+    def choose_encoder(self, request, response):
+        """The encoder to compress ``response`` with, or None to send it as is."""
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        # Event streams are never compressed, whatever CONTENT_TYPES says: a
+        # compressor buffers, and each event must reach the client as sent
+        if content_type == 'text/event-stream':
+            return None
+        if content_type not in self.conf['CONTENT_TYPES'] or response.has_header('Content-Encoding'):
+            return None
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not response.streaming and len(response.content) < self.conf['MIN_SIZE']:
+            return None
+        return self.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+    def encode(self, request, response, encoder):
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.compress_async_stream(encoder, response.streaming_content)
+            else:
+                response.streaming_content = self.compress_stream(encoder, response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            response.content = self.compress(request, encoder, response.content)
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # The representation changed, so a strong validator no longer applies
+        if response.has_header('ETag'):
+            response.headers['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        response.headers['Content-Encoding'] = encoder.name
+
+    def negotiate(self, header):
+        accepted = parse_accept_encoding(header)
+        wildcard = accepted.get('*', 0)
+        best, best_q = None, 0
+        for encoder in self.encoders:
+            q = accepted.get(encoder.name, wildcard)
+            if q > best_q:
+                best, best_q = encoder, q
+        return best
+
+    def compress(self, request, encoder, content):
+        user = getattr(request, 'user', None)
+        if (user is not None and user.is_authenticated) or len(content) > self.conf['CACHE_MAX_SIZE']:
+            return encoder.compress(content)
+
+        # Anonymous pages repeat, so keep their compressed bytes around
+        cache = caches[self.conf['CACHE']]
+        digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        key = f'compressed:{encoder.name}:{encoder.level}:{digest}'
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = encoder.compress(content)
+            cache.set(key, compressed, self.conf['CACHE_TIMEOUT'])
+        return compressed
+
+    def compress_stream(self, encoder, chunks):
+        compressor = encoder.compressor()
+        for chunk in chunks:
+            data = encoder.chunk(compressor, chunk)
+            if data:
+                yield data
+        yield encoder.finish(compressor)
+
+    async def compress_async_stream(self, encoder, chunks):
+        compressor = encoder.compressor()
+        async for chunk in chunks:
+            data = encoder.chunk(compressor, chunk)
+            if data:
+                yield data
+        yield encoder.finish(compressor)
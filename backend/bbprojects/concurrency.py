@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def read_pool():
+    """
+    The threads independent reads run on, READ_THREADS of them per process.
+
+    They keep their database connections between reads, so CONN_MAX_AGE and
+    the connection pool apply to them as they do to request threads.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.READ_THREADS, thread_name_prefix='read')
+        return _pool
+
+def run_pooled(func):
+    """Wrap ``func`` to drop the worker thread's expired or broken connections around it, as requests do."""
+    def wrapper():
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return wrapper
+
+def run_reads(*funcs, concurrent=True):
+    """
+    Run independent, read-only ORM callables and return their results in order.
+
+    With ``concurrent`` the callables run side by side on ``read_pool()``,
+    each on its thread's connection. Inside a transaction (tests,
+    ATOMIC_REQUESTS) other connections cannot see uncommitted rows, so the
+    callables always run one after another on the caller's connection.
+    """
+    if not concurrent or len(funcs) < 2 or connection.in_atomic_block:
+        return [func() for func in funcs]
+    futures = [read_pool().submit(run_pooled(func)) for func in funcs]
+    return [future.result() for future in futures]
+
+async def gather_reads(*funcs):
+    """Async counterpart of ``run_reads`` built on ``asyncio.gather``."""
+    if connection.in_atomic_block:
+        return [await sync_to_async(func)() for func in funcs]
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(
+        loop.run_in_executor(read_pool(), run_pooled(func)) for func in funcs
+    ))
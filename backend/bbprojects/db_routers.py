@@ -0,0 +1,130 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current_request = ContextVar('bbprojects_routing_request', default=None)
+
+def replica_aliases():
+    return [alias for alias in connections if alias.startswith('replica')]
+
+def _pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+def pin_to_primary(user_id):
+    """Send the user's reads to the primary for REPLICA_PIN_SECONDS (read-your-writes)."""
+    cache.set(_pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+async def apin_to_primary(user_id):
+    await cache.aset(_pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+def _reads_from_primary(request):
+    if request.method not in SAFE_METHODS:
+        return True
+    # Reads inside a write transaction must see its uncommitted rows
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return True
+    # DRF copies the authenticated user onto the Django request; until then
+    # (e.g. the JWT user lookup itself) the request counts as anonymous
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return False
+    pinned = getattr(request, '_db_pinned', None)
+    if pinned is None or pinned[0] != user.pk:
+        pinned = request._db_pinned = (user.pk, bool(cache.get(_pin_key(user.pk))))
+    return pinned[1]
+
+class PrimaryReplicaRouter:
+    """
+    Send reads made while serving a safe-method request to a random replica
+    (any DATABASES alias starting with "replica"); everything else, including
+    reads of users who wrote in the last REPLICA_PIN_SECONDS, goes to the
+    primary. Reads outside a request (commands, workers) use the primary.
+    """
+
+    def __init__(self, replicas=None):
+        self._replicas = replicas
+
+    @property
+    def replicas(self):
+        return replica_aliases() if self._replicas is None else self._replicas
+
+    def db_for_read(self, model, **hints):
+        request = _current_request.get()
+        if not self.replicas or request is None or _reads_from_primary(request):
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in self.replicas
+
+class ReplicaRoutingMiddleware:
+    """
+    Expose the request to the router and pin users to the primary after a
+    write. The pins live in the default cache, which every worker process
+    must share; with a per-process cache a user's next request could land on
+    another worker and read stale rows from a replica.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        if isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache)):
+            raise ImproperlyConfigured(
+                'Read replicas need a cache shared by all workers for read-your-writes '
+                'pinning; set REDIS_URL.')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+        return response
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context, so the router sees the request
+        # from whichever thread runs the queries
+        token = _current_request.set(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            user = getattr(request, 'user', None)
+            if isinstance(user, SimpleLazyObject):
+                # Still the session user (DRF didn't authenticate); loading
+                # it from here would block the event loop
+                user = await request.auser()
+            if user is not None and user.is_authenticated:
+                await apin_to_primary(user.pk)
+        return response
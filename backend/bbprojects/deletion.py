@@ -0,0 +1,206 @@
+"""
+Deleting users, snippets and collections in two steps.
+
+``soft_delete()`` sets ``deleted_at`` with a few UPDATEs (for a user, on
+everything they own too), which hides the rows from every default manager,
+and queues a ``purge_deleted`` task. That task always goes to the Task table
+for ``manage.py run_worker``, even with BACKGROUND_TASKS['EAGER'], so a
+large purge never runs inside the deleting request. The task removes the dependent rows in
+batches of DELETION['BATCH_SIZE'] with plain DELETE statements and refreshes
+the counters they feed as it goes. Django's collector would load every
+related row into memory first and delete them all in one transaction.
+"""
+import logging
+import time
+
+from allauth.account.models import EmailAddress
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import User, Snippet, Collection, CodeBlob, SearchSuggestion, Change
+from .signals import invalidate_activity_feeds
+from .suggest import kind_of, invalidate_suggestions, invalidate_all_suggestions
+from .tasks import enqueue, refresh_likes_count, refresh_snippet_count
+
+logger = logging.getLogger(__name__)
+
+DELETION_DEFAULTS = {
+    'BATCH_SIZE': 1000,
+    # A purge task stops after this many seconds and queues the rest as a
+    # new task, so one huge account doesn't hold a worker (or outlive its lease)
+    'TIME_BUDGET': 30,
+}
+
+MODELS = {'user': User, 'snippet': Snippet, 'collection': Collection}
+
+Like = Snippet.likes.through
+Membership = Collection.snippets.through
+
+def deletion_settings():
+    return {**DELETION_DEFAULTS, **getattr(settings, 'DELETION', {})}
+
+def deleted_username(pk):
+    # ':' is not allowed in usernames, so this never clashes with a real one
+    return f'deleted:{pk}'
+
+def soft_delete(instance):
+    """Hide ``instance`` now and queue the purge of it and its dependents."""
+    model = type(instance)
+    name = model._meta.model_name
+    now = timezone.now()
+    with transaction.atomic():
+        if model is User:
+            # Uniqueness checks (forms, serializers, allauth) go through the
+            # default manager, which no longer sees this row: free the
+            # username and email so signing up with them again works
+            User.all_objects.filter(pk=instance.pk).update(
+                deleted_at=now, is_active=False, username=deleted_username(instance.pk), email='',
+            )
+            EmailAddress.objects.filter(user_id=instance.pk).delete()
+            snippets = Snippet.all_objects.filter(owner_id=instance.pk, deleted_at__isnull=True)
+            collection_ids = _collections_of(snippets)
+            snippets.update(deleted_at=now)
+            Collection.all_objects.filter(owner_id=instance.pk, deleted_at__isnull=True).update(deleted_at=now)
+            # Their rows leave the typeahead at once; the purge deletes them
+            SearchSuggestion.objects.filter(owner_id=instance.pk).update(is_public=False)
+        else:
+            collection_ids = _collections_of(model.all_objects.filter(pk=instance.pk)) if model is Snippet else []
+            model.all_objects.filter(pk=instance.pk).update(deleted_at=now)
+            Change.objects.record(name, [instance.pk], deleted=True)
+        if collection_ids:
+            # Their snippet_count leaves out deleted snippets
+            enqueue('refresh_snippet_count', {'collection_ids': collection_ids})
+        suggestion = SearchSuggestion.objects.filter(kind=kind_of(model), object_id=instance.pk)
+        keys = list(suggestion.values_list('key', flat=True))
+        suggestion.delete()
+        enqueue('purge_deleted', {'model': name, 'id': instance.pk}, eager=False)
+    instance.deleted_at = now
+    if model is User:
+        instance.username, instance.email = deleted_username(instance.pk), ''
+
+    if model is User:
+        invalidate_activity_feeds(instance.pk, profile_ids=[instance.pk])
+    else:
+        invalidate_activity_feeds(instance.owner_id, snippet_ids=[instance.pk] if model is Snippet else ())
+    if model is User:
+        invalidate_all_suggestions()
+    else:
+        invalidate_suggestions(*keys)
+
+def _collections_of(snippets):
+    """Ids of the collections, not themselves deleted, that hold any of ``snippets``."""
+    return sorted(set(
+        Membership.objects.filter(snippet__in=snippets.values('pk'), collection__deleted_at__isnull=True)
+        .values_list('collection_id', flat=True)
+    ))
+
+def _delete_batches(queryset, batch_size, column=None, after=None):
+    """
+    Delete ``queryset`` ``batch_size`` rows at a time, yielding how many each
+    batch removed. Only for tables nothing points at and without delete
+    signals, so every DELETE runs without loading the rows. ``after`` gets
+    the distinct ``column`` values of each batch, in its transaction.
+    """
+    fields = ('pk', column) if column else ('pk',)
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.order_by('pk').values_list(*fields)[:batch_size])
+            if not rows:
+                return
+            queryset.model.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            if after:
+                after(sorted({row[1] for row in rows}))
+        yield len(rows)
+
+def _refresh_likes(snippet_ids):
+    refresh_likes_count([{'snippet_ids': snippet_ids}])
+
+def _refresh_snippet_counts(collection_ids):
+    refresh_snippet_count([{'collection_ids': collection_ids}])
+
+def _purge_snippets(snippets, batch_size):
+    """Steps removing ``snippets`` (an all_objects queryset) with their likes, memberships and orphaned code."""
+    yield from (('likes', n) for n in _delete_batches(
+        Like.objects.filter(snippet__in=snippets.values('pk')), batch_size))
+    yield from (('memberships', n) for n in _delete_batches(
+        Membership.objects.filter(snippet__in=snippets.values('pk')), batch_size,
+        'collection_id', _refresh_snippet_counts))
+    while True:
+        with transaction.atomic():
+            rows = list(snippets.order_by('pk').values_list('pk', 'code_blob_id')[:batch_size])
+            if not rows:
+                return
+            pks, digests = [pk for pk, _ in rows], {digest for _, digest in rows}
+            Change.objects.record(Change.SNIPPET, pks, deleted=True)
+            SearchSuggestion.objects.filter(kind='snippet', object_id__in=pks).delete()
+            # Snippets send delete signals, so QuerySet.delete() would load
+            # each one; nothing points at them any more, so delete directly
+            batch = Snippet.all_objects.filter(pk__in=pks)
+            batch._raw_delete(batch.db)
+            orphans = CodeBlob.objects.unreferenced().filter(digest__in=digests)
+            orphans._raw_delete(orphans.db)
+        yield 'snippets', len(rows)
+
+def _purge_collections(collections, batch_size):
+    """Steps removing ``collections`` (an all_objects queryset) with their memberships."""
+    yield from (('memberships', n) for n in _delete_batches(
+        Membership.objects.filter(collection__in=collections.values('pk')), batch_size))
+    while True:
+        with transaction.atomic():
+            pks = list(collections.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return
+            Change.objects.record(Change.COLLECTION, pks, deleted=True)
+            SearchSuggestion.objects.filter(kind='collection', object_id__in=pks).delete()
+            batch = Collection.all_objects.filter(pk__in=pks)
+            batch._raw_delete(batch.db)
+        yield 'collections', len(pks)
+
+def purge_steps(name, pk, batch_size):
+    """
+    Delete the soft-deleted ``name`` object ``pk`` and its dependents one
+    batch at a time, yielding ``(step, rows deleted)`` after each batch. Every
+    batch re-reads what is left, so a purge can stop and resume anywhere.
+    """
+    if name == 'snippet':
+        yield from _purge_snippets(Snippet.all_objects.filter(pk=pk, deleted_at__isnull=False), batch_size)
+    elif name == 'collection':
+        yield from _purge_collections(Collection.all_objects.filter(pk=pk, deleted_at__isnull=False), batch_size)
+    elif name == 'user':
+        if not User.all_objects.filter(pk=pk, deleted_at__isnull=False).exists():
+            return
+        yield from (('likes', n) for n in _delete_batches(
+            Like.objects.filter(user_id=pk), batch_size, 'snippet_id', _refresh_likes))
+        yield from _purge_collections(Collection.all_objects.filter(owner_id=pk), batch_size)
+        yield from _purge_snippets(Snippet.all_objects.filter(owner_id=pk), batch_size)
+        yield from (('suggestions', n) for n in _delete_batches(
+            SearchSuggestion.objects.filter(owner_id=pk), batch_size))
+        # What is left (email addresses, tokens, admin log entries) is small;
+        # let the collector handle it
+        with transaction.atomic():
+            User.all_objects.filter(pk=pk).delete()
+        yield 'users', 1
+    else:
+        raise ValueError(f'Cannot purge {name!r}')
+
+def purge(name, pk, batch_size=None, time_budget=None, progress=None):
+    """
+    Run ``purge_steps`` until the object is gone (returns True) or
+    ``time_budget`` seconds have passed (returns False). ``progress(step,
+    rows, total)`` is called after each batch.
+    """
+    conf = deletion_settings()
+    started = time.monotonic()
+    totals = {}
+    try:
+        for step, rows in purge_steps(name, pk, batch_size or conf['BATCH_SIZE']):
+            totals[step] = totals.get(step, 0) + rows
+            if progress:
+                progress(step, rows, totals[step])
+            if time_budget is not None and time.monotonic() - started > time_budget:
+                return False
+        return True
+    finally:
+        logger.info('purge', extra={'model': name, 'id': pk, 'deleted': totals,
+                                    'duration_ms': round((time.monotonic() - started) * 1000, 2)})
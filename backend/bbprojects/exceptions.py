@@ -19,4 +19,9 @@ class ResourceNotFoundError(APIException):
 class DuplicateResourceError(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = 'This resource already exists.'
-    default_code = 'duplicate_resource' 
\ No newline at end of file
+    default_code = 'duplicate_resource' 
+
+class SyncTokenExpiredError(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'This sync token is older than the change log. Fetch the full lists again.'
+    default_code = 'sync_token_expired'
@@ -0,0 +1,189 @@
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, Q
+from rest_framework import serializers
+
+from .concurrency import run_reads, gather_reads
+from .models import Snippet
+from .serializers import SnippetSerializer, CollectionSerializer
+
+FEED_DEFAULTS = {
+    'DEFAULT_KINDS': ['snippets', 'collections'],
+    'DEFAULT_LIMIT': 5,
+    'MAX_LIMIT': 50,
+    'CONCURRENT': False,
+    'CACHE_TIMEOUT': 60,
+}
+
+def feed_settings():
+    return {**FEED_DEFAULTS, **getattr(settings, 'ACTIVITY_FEED', {})}
+
+def parse_feed_params(query_params):
+    """Validate the ``kinds`` and ``limit`` query parameters of the activity feed."""
+    conf = feed_settings()
+
+    kinds = query_params.get('kinds')
+    kinds = [k for k in kinds.split(',') if k] if kinds else list(conf['DEFAULT_KINDS'])
+    unknown = [k for k in kinds if k not in SECTIONS]
+    if unknown:
+        raise serializers.ValidationError(
+            {'kinds': f"Unknown kinds: {', '.join(unknown)}. Choose from {', '.join(SECTIONS)}."}
+        )
+
+    try:
+        limit = int(query_params.get('limit', conf['DEFAULT_LIMIT']))
+    except ValueError:
+        raise serializers.ValidationError({'limit': 'A valid integer is required.'})
+    if not 1 <= limit <= conf['MAX_LIMIT']:
+        raise serializers.ValidationError({'limit': f"Must be between 1 and {conf['MAX_LIMIT']}."})
+
+    return sorted(set(kinds), key=list(SECTIONS).index), limit
+
+def _snippets_for(user):
+    return Snippet.objects.select_related('owner', 'code_blob').with_like_info(user)
+
+# Each section returns its data and the dependency keys (see feed_dependency)
+# of what other users own that it shows; the user's own objects are covered
+# by their feed version.
+
+def _shown(snippets):
+    return {feed_dependency('snippet', s.pk) for s in snippets} | {feed_dependency('user', s.owner_id) for s in snippets}
+
+def _recent_snippets(user, context, limit):
+    snippets = _snippets_for(user).filter(owner=user).order_by('-created_at')[:limit]
+    return SnippetSerializer(snippets, many=True, context=context).data, set()
+
+def _recent_collections(user, context, limit):
+    collections = list(
+        user.collections.select_related('owner')
+        .prefetch_related(Prefetch('snippets', queryset=_snippets_for(user)))
+        .order_by('-created_at')[:limit]
+    )
+    shown = _shown([snippet for collection in collections for snippet in collection.snippets.all()])
+    return CollectionSerializer(collections, many=True, context=context).data, shown
+
+def _likes_given(user, context, limit):
+    # The likes through table has no timestamp; its id follows insertion order
+    snippet_ids = list(
+        Snippet.likes.through.objects.filter(user=user)
+        .order_by('-id').values_list('snippet_id', flat=True)[:limit]
+    )
+    snippets = _snippets_for(user).filter(
+        Q(is_public=True) | Q(owner=user), pk__in=snippet_ids
+    )
+    by_id = {snippet.pk: snippet for snippet in snippets}
+    ordered = [by_id[pk] for pk in snippet_ids if pk in by_id]
+    # Hidden ones too: they show up here once made public again
+    shown = _shown(ordered) | {feed_dependency('snippet', pk) for pk in snippet_ids}
+    return SnippetSerializer(ordered, many=True, context=context).data, shown
+
+def _likes_received(user, context, limit):
+    likes = (
+        Snippet.likes.through.objects.filter(snippet__owner=user)
+        .select_related('snippet', 'user').order_by('-id')[:limit]
+    )
+    data = [
+        {
+            'snippet': {'id': like.snippet_id, 'title': like.snippet.title},
+            'user': {'id': like.user_id, 'username': like.user.username},
+        }
+        for like in likes
+    ]
+    return data, {feed_dependency('user', like.user_id) for like in likes}
+
+# kind -> (response key, section builder)
+SECTIONS = {
+    'snippets': ('recent_snippets', _recent_snippets),
+    'collections': ('recent_collections', _recent_collections),
+    'likes_given': ('likes_given', _likes_given),
+    'likes_received': ('likes_received', _likes_received),
+}
+
+def _version_key(user_id):
+    return f'activity-feed-version:{user_id}'
+
+def feed_dependency(kind, pk):
+    """Key whose version changes when a ``kind`` ('snippet' or 'user') shown in other users' feeds changes."""
+    return f'activity-feed-{kind}:{pk}'
+
+def _feed_key(user_id, version, kinds, limit):
+    return f"activity-feed:{user_id}:{version}:{','.join(kinds)}:{limit}"
+
+def _new_versions(keys):
+    return {key: uuid.uuid4().hex for key in keys}
+
+# Versions are random and a missing one is created rather than read as a
+# default, so after an eviction a key can never get back a value that an
+# older cached feed was stored under.
+
+def _versions(keys):
+    versions = cache.get_many(keys)
+    for key, version in _new_versions(set(keys) - set(versions)).items():
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        versions[key] = version
+    return versions
+
+async def _aversions(keys):
+    versions = await cache.aget_many(keys)
+    for key, version in _new_versions(set(keys) - set(versions)).items():
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+        versions[key] = version
+    return versions
+
+def _builders(request, kinds, limit):
+    context = {'request': request}
+    return [partial(SECTIONS[kind][1], request.user, context, limit) for kind in kinds]
+
+def _assemble(kinds, results):
+    feed = {SECTIONS[kind][0]: data for kind, (data, _) in zip(kinds, results)}
+    return feed, set().union(*(shown for _, shown in results))
+
+def get_activity_feed(request, kinds, limit):
+    """
+    Build (or fetch from cache) the activity feed of ``request.user``.
+
+    Every section runs a fixed number of queries regardless of ``limit``.
+    A cached feed is used only while none of the other users' snippets and
+    profiles it shows have changed.
+    """
+    conf = feed_settings()
+    user = request.user
+    version_key = _version_key(user.pk)
+    key = _feed_key(user.pk, _versions([version_key])[version_key], kinds, limit)
+    cached = cache.get(key)
+    if cached is not None and cache.get_many(cached['versions']) == cached['versions']:
+        return cached['feed']
+    results = run_reads(*_builders(request, kinds, limit), concurrent=conf['CONCURRENT'])
+    feed, shown = _assemble(kinds, results)
+    cache.set(key, {'feed': feed, 'versions': _versions(shown)}, conf['CACHE_TIMEOUT'])
+    return feed
+
+async def aget_activity_feed(request, kinds, limit):
+    """Async counterpart of ``get_activity_feed``; sections always run concurrently."""
+    conf = feed_settings()
+    user = request.user
+    version_key = _version_key(user.pk)
+    key = _feed_key(user.pk, (await _aversions([version_key]))[version_key], kinds, limit)
+    cached = await cache.aget(key)
+    if cached is not None and await cache.aget_many(cached['versions']) == cached['versions']:
+        return cached['feed']
+    results = await gather_reads(*_builders(request, kinds, limit))
+    feed, shown = _assemble(kinds, results)
+    await cache.aset(key, {'feed': feed, 'versions': await _aversions(shown)}, conf['CACHE_TIMEOUT'])
+    return feed
+
+def invalidate_activity_feeds(*user_ids, snippet_ids=(), profile_ids=()):
+    """
+    Drop every cached feed variant of ``user_ids``, and every cached feed
+    showing the snippets ``snippet_ids`` or the profiles of ``profile_ids``.
+    """
+    keys = [_version_key(user_id) for user_id in set(user_ids) if user_id]
+    keys += [feed_dependency('snippet', pk) for pk in set(snippet_ids)]
+    keys += [feed_dependency('user', pk) for pk in set(profile_ids)]
+    if keys:
+        cache.set_many(_new_versions(keys), None)
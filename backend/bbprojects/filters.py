@@ -19,7 +19,10 @@ class SnippetFilter(filters.FilterSet):
 class CollectionFilter(filters.FilterSet):
     created_after = filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_before = filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
-    snippets_count = filters.NumberFilter(method='filter_snippets_count')
+    # Read the stored, indexed counter rather than counting memberships
+    snippets_count = filters.NumberFilter(field_name='snippet_count')
+    snippet_count_min = filters.NumberFilter(field_name='snippet_count', lookup_expr='gte')
+    snippet_count_max = filters.NumberFilter(field_name='snippet_count', lookup_expr='lte')
     owner_username = filters.CharFilter(field_name='owner__username', lookup_expr='iexact')
 
     class Meta:
@@ -29,6 +32,3 @@ class CollectionFilter(filters.FilterSet):
             'description': ['icontains'],
             'is_public': ['exact'],
         }
-
-    def filter_snippets_count(self, queryset, name, value):
-        return queryset.annotate(count=models.Count('snippets')).filter(count=value) 
\ No newline at end of file
@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+PERF_DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'WINDOW': 1024,
+}
+
+def perf_settings():
+    return {**PERF_DEFAULTS, **getattr(settings, 'PERF_INSTRUMENTATION', {})}
+
+@contextmanager
+def timed(request, name):
+    """Add the wall time of the block to the request's ``name`` timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        # DRF requests wrap the HttpRequest the middleware sees
+        timings = getattr(getattr(request, '_request', request), '_perf_timings', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+class QueryTracker:
+    """
+    DB execute wrapper that counts queries, sums their wall time and tallies
+    each SQL statement, so repeated statements (N+1 patterns) stand out.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Number of queries that repeated an earlier statement."""
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+    def repeated(self):
+        """``(count, sql)`` pairs for statements that ran more than once."""
+        return [(n, sql) for sql, n in self.statements.most_common() if n > 1]
+
+    def track(self, stack):
+        """Install the tracker on every configured database inside ``stack``."""
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+class RouteMetrics:
+    """Rolling window of per-request samples, grouped by route."""
+
+    FIELDS = ('duration', 'db', 'serialize', 'render', 'queries')
+
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.totals = defaultdict(Counter)
+
+    def record(self, route, method, status, duration, db, serialize, render, queries, duplicates):
+        key = (route, method)
+        with self.lock:
+            self.samples[key].append((duration, db, serialize, render, queries))
+            totals = self.totals[key]
+            totals['requests'] += 1
+            totals['errors'] += status >= 500
+            totals['queries'] += queries
+            totals['duplicate_queries'] += duplicates
+
+    def snapshot(self):
+        with self.lock:
+            return (
+                {key: list(samples) for key, samples in self.samples.items()},
+                {key: dict(totals) for key, totals in self.totals.items()},
+            )
+
+    def prometheus(self):
+        """Render the current window in the Prometheus text exposition format."""
+        # utils imports DRF, which this module must not load at startup
+        from .utils import percentile
+
+        samples, totals = self.snapshot()
+        lines = []
+
+        summaries = [
+            ('bbprojects_request_duration_seconds', 0, 'Request latency'),
+            ('bbprojects_db_duration_seconds', 1, 'Time spent in database queries per request'),
+            ('bbprojects_serialize_duration_seconds', 2, 'Time spent serializing list pages'),
+            ('bbprojects_render_duration_seconds', 3, 'Time spent rendering the response body'),
+            ('bbprojects_db_queries', 4, 'Database queries per request'),
+        ]
+        for name, index, help_text in summaries:
+            lines.append(f'# HELP {name} {help_text} (last {self.window} requests per route).')
+            lines.append(f'# TYPE {name} summary')
+            for (route, method), rows in sorted(samples.items()):
+                values = sorted(row[index] for row in rows)
+                labels = f'route="{route}",method="{method}"'
+                for q in (50, 95, 99):
+                    lines.append(f'{name}{{{labels},quantile="{q / 100}"}} {percentile(values, q)}')
+                lines.append(f'{name}_sum{{{labels}}} {sum(values)}')
+                lines.append(f'{name}_count{{{labels}}} {len(values)}')
+
+        counters = [
+            ('bbprojects_requests_total', 'requests', 'Requests handled by this process'),
+            ('bbprojects_request_errors_total', 'errors', 'Requests that ended in a 5xx response'),
+            ('bbprojects_db_queries_total', 'queries', 'Database queries run by this process'),
+            ('bbprojects_db_duplicate_queries_total', 'duplicate_queries',
+             'Queries that repeated a statement already run in the same request'),
+        ]
+        for name, field, help_text in counters:
+            lines.append(f'# HELP {name} {help_text}.')
+            lines.append(f'# TYPE {name} counter')
+            for (route, method), counts in sorted(totals.items()):
+                lines.append(f'{name}{{route="{route}",method="{method}"}} {counts.get(field, 0)}')
+
+        return '\n'.join(lines) + '\n'
+
+metrics = RouteMetrics(perf_settings()['WINDOW'])
+
+class PerformanceMiddleware:
+    """
+    Measure query count, duplicate queries, DB time, serialization time,
+    render time and total latency of every request and feed the per-route
+    histograms served at /api/_metrics. Staff users (and everyone under
+    DEBUG) also get the numbers in a ``Server-Timing`` header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        conf = perf_settings()
+        if not conf['ENABLED']:
+            raise MiddlewareNotUsed
+        self.server_timing = conf['SERVER_TIMING']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django awaits template response hooks under ASGI; a sync one
+            # would cost a thread hop just to read the clock
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = self.start(request)
+        with ExitStack() as stack:
+            tracker = QueryTracker().track(stack)
+            response = self.get_response(request)
+        return self.finish(request, response, tracker, started, self.show_timing(request))
+
+    async def __acall__(self, request):
+        started = self.start(request)
+        # Queries run on the request's sync_to_async thread, not on the
+        # event loop, so the tracker is installed on that thread's connections
+        stack = ExitStack()
+        tracker = await sync_to_async(QueryTracker().track)(stack)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await sync_to_async(stack.close)()
+            raise
+        # request.user may still have to be loaded from the session
+        show_timing = await sync_to_async(self.stop)(stack, request)
+        return self.finish(request, response, tracker, started, show_timing)
+
+    def start(self, request):
+        request._perf_view_finished = None
+        request._perf_timings = {}
+        return time.perf_counter()
+
+    def stop(self, stack, request):
+        stack.close()
+        return self.show_timing(request)
+
+    def finish(self, request, response, tracker, started, show_timing):
+        finished = time.perf_counter()
+
+        duration = finished - started
+        serialize = request._perf_timings.get('serialize', 0.0)
+        # DRF responses are rendered after process_template_response runs
+        view_finished = request._perf_view_finished
+        render = finished - view_finished if view_finished else 0.0
+
+        match = request.resolver_match
+        route = match.view_name if match else 'unresolved'
+        metrics.record(route, request.method, response.status_code, duration,
+                       tracker.duration, serialize, render, tracker.count, tracker.duplicates)
+
+        if self.server_timing and show_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={tracker.duration * 1000:.2f};desc="{tracker.count} queries"',
+                f'dupq;desc="{tracker.duplicates} duplicate queries"',
+                f'serialize;dur={serialize * 1000:.2f}',
+                f'render;dur={render * 1000:.2f}',
+                f'total;dur={duration * 1000:.2f}',
+            ])
+        return response
+
+    def show_timing(self, request):
+        if settings.DEBUG:
+            return True
+        # Set by AuthenticationMiddleware, and by DRF once it authenticates
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
+
+    def process_template_response(self, request, response):
+        request._perf_view_finished = time.perf_counter()
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        request._perf_view_finished = time.perf_counter()
+        return response
@@ -0,0 +1,423 @@
+"""
+Live like counts, collection sizes and memberships over Server-Sent Events.
+
+Each ASGI worker runs one Hub. Streams subscribe to snippet and collection
+ids; the hub reads changes from a backend (by default the Change log behind
+/api/sync/changes, polled once per worker however many streams are open),
+loads the current counts of the ids someone is watching and pushes them to
+the matching subscriptions. A subscription keeps only the latest update per
+id and sends each id at most once per DEBOUNCE_SECONDS, so a burst of likes
+on one snippet becomes a single event.
+"""
+import asyncio
+import io
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Change, Collection, Snippet, User
+
+logger = logging.getLogger(__name__)
+
+LIVE_DEFAULTS = {
+    'BACKEND': 'bbprojects.live.ChangeLogBackend',
+    'POLL_INTERVAL': 1.0,
+    'DEBOUNCE_SECONDS': 1.0,
+    # Comment lines keep idle connections open through proxies
+    'HEARTBEAT_SECONDS': 15,
+    'MAX_IDS': 200,
+    # Open streams per worker; more get a 503
+    'MAX_CONNECTIONS': 5000,
+    'RETRY_MS': 5000,
+    # Threads (and so database connections) per worker for the hub's queries
+    'DB_THREADS': 2,
+    # Lifetime of the ?token= from POST /api/live/token. EventSource cannot
+    # send an Authorization header, so cross-origin streams authenticate with it
+    'TOKEN_MAX_AGE': 60,
+}
+
+TOKEN_SALT = 'bbprojects.live'
+
+def live_settings():
+    return {**LIVE_DEFAULTS, **getattr(settings, 'LIVE_UPDATES', {})}
+
+def _parse_ids(query_params, name):
+    raw = query_params.get(name, '')
+    try:
+        return {int(part) for part in raw.split(',') if part.strip()}
+    except ValueError:
+        raise serializers.ValidationError({name: 'A comma-separated list of integers is required.'})
+
+def parse_live_params(query_params):
+    """The ``(snippet ids, collection ids)`` a stream subscribes to."""
+    snippets, collections = _parse_ids(query_params, 'snippets'), _parse_ids(query_params, 'collections')
+    if not snippets and not collections:
+        raise serializers.ValidationError({'snippets': 'Subscribe to at least one snippet or collection.'})
+    max_ids = live_settings()['MAX_IDS']
+    if len(snippets) + len(collections) > max_ids:
+        raise serializers.ValidationError({'snippets': f'At most {max_ids} ids per stream.'})
+    return snippets, collections
+
+# Topics are (Change.SNIPPET, id) and (Change.COLLECTION, id). Updates are
+# (topic, key, payload, is_public, owner_id); the key decides which updates
+# replace each other while waiting to be sent.
+
+def load_updates(snippet_ids, collection_ids):
+    """Current counts of these objects; gone ones come through as deletions."""
+    close_old_connections()
+    updates = []
+    snippets = {
+        pk: row for pk, *row in
+        Snippet.objects.filter(pk__in=snippet_ids).values_list('pk', 'likes_count', 'is_public', 'owner_id')
+    }
+    for pk in snippet_ids:
+        topic = (Change.SNIPPET, pk)
+        if pk in snippets:
+            likes_count, is_public, owner_id = snippets[pk]
+            payload = {'type': Change.SNIPPET, 'id': pk, 'likes_count': likes_count}
+            updates.append((topic, topic, payload, is_public, owner_id))
+        else:
+            updates.append((topic, topic, {'type': Change.SNIPPET, 'id': pk, 'deleted': True}, True, None))
+    collections = {
+        pk: row for pk, *row in
+        Collection.objects.filter(pk__in=collection_ids).values_list('pk', 'snippet_count', 'is_public', 'owner_id')
+    }
+    for pk in collection_ids:
+        topic = (Change.COLLECTION, pk)
+        if pk in collections:
+            snippet_count, is_public, owner_id = collections[pk]
+            payload = {'type': Change.COLLECTION, 'id': pk, 'snippet_count': snippet_count}
+            updates.append((topic, topic, payload, is_public, owner_id))
+        else:
+            updates.append((topic, topic, {'type': Change.COLLECTION, 'id': pk, 'deleted': True}, True, None))
+    return updates, collections
+
+def build_updates(changes, watched):
+    """
+    Updates for the ``(kind, object_id, related_id, deleted)`` changes that
+    touch a watched topic: current counts, plus membership adds and removals
+    for watched collections.
+    """
+    snippet_ids, collection_ids, memberships = set(), set(), {}
+    for kind, object_id, related_id, deleted in changes:
+        if kind == Change.SNIPPET and (kind, object_id) in watched:
+            snippet_ids.add(object_id)
+        elif kind == Change.COLLECTION and (kind, object_id) in watched:
+            collection_ids.add(object_id)
+        elif kind == Change.MEMBERSHIP and (Change.COLLECTION, object_id) in watched:
+            memberships[(object_id, related_id)] = deleted
+    # Memberships are shown to whoever may see their collection; its count
+    # comes along (the hub drops it if unchanged)
+    updates, collections = load_updates(snippet_ids, collection_ids | {pk for pk, _ in memberships})
+    for (collection_id, snippet_id), deleted in memberships.items():
+        if collection_id not in collections:
+            continue
+        _, is_public, owner_id = collections[collection_id]
+        payload = {'type': Change.MEMBERSHIP, 'collection': collection_id, 'snippet': snippet_id,
+                   'op': 'delete' if deleted else 'add'}
+        updates.append(((Change.COLLECTION, collection_id), (Change.MEMBERSHIP, collection_id, snippet_id),
+                        payload, is_public, owner_id))
+    return updates
+
+class Subscription:
+    """One stream's topics and the updates waiting to be sent to it."""
+
+    def __init__(self, user_id, topics):
+        self.user_id = user_id
+        self.topics = topics
+        # key -> (topic, payload); a newer update for the same key replaces it
+        self.pending = {}
+        # topic -> when it was last sent (monotonic seconds)
+        self.sent_at = {}
+        self.wake = asyncio.Event()
+
+    def push(self, topic, key, payload, is_public, owner_id):
+        if not is_public and owner_id != self.user_id:
+            # Gone private: the stream stops receiving it, like a deletion
+            if payload['type'] == Change.MEMBERSHIP:
+                return
+            payload = {'type': payload['type'], 'id': payload['id'], 'deleted': True}
+        self.pending.pop(key, None)
+        self.pending[key] = (topic, payload)
+        self.wake.set()
+
+    def take_due(self, now, debounce):
+        """Pop the pending updates whose topic is out of its debounce window."""
+        due = [key for key, (topic, _) in self.pending.items()
+               if self.sent_at.get(topic, float('-inf')) + debounce <= now]
+        payloads = []
+        for key in due:
+            topic, payload = self.pending.pop(key)
+            self.sent_at[topic] = now
+            payloads.append(payload)
+        return payloads
+
+    async def updates(self):
+        """
+        Yield lists of payloads as they come due, and None whenever the stream
+        has been quiet for HEARTBEAT_SECONDS.
+        """
+        conf = live_settings()
+        debounce, heartbeat = conf['DEBOUNCE_SECONDS'], conf['HEARTBEAT_SECONDS']
+        while True:
+            now = time.monotonic()
+            payloads = self.take_due(now, debounce)
+            if payloads:
+                yield payloads
+                continue
+            timeout = heartbeat
+            if self.pending:
+                timeout = min(self.sent_at[topic] + debounce for topic, _ in self.pending.values()) - now
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                if not self.pending:
+                    yield None
+
+class Hub:
+    """
+    Fans changes from the backend out to this worker's subscriptions. Its
+    database work runs on a small thread pool of its own, so the number of
+    connections it holds doesn't grow with the number of streams.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=live_settings()['DB_THREADS'], thread_name_prefix='live')
+        # topic -> set of subscriptions
+        self.subscribers = {}
+        self.connections = 0
+        self.listener = None
+        # key -> last update sent for it, to skip repeats (a title edit logs
+        # a snippet change without touching its likes)
+        self.last = {}
+
+    async def run_sync(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+
+    def subscribe(self, user_id, topics):
+        subscription = Subscription(user_id, topics)
+        for topic in topics:
+            self.subscribers.setdefault(topic, set()).add(subscription)
+        self.connections += 1
+        if self.listener is None:
+            self.listener = asyncio.create_task(self.listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for topic in subscription.topics:
+            watchers = self.subscribers.get(topic)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.subscribers[topic]
+                    self.last = {key: update for key, update in self.last.items() if update[0] != topic}
+        self.connections -= 1
+        # Nobody is listening: stop polling until the next stream opens
+        if not self.connections and self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+
+    async def listen(self):
+        async for changes in self.backend.changes(self):
+            try:
+                await self.dispatch(changes)
+            except Exception:
+                logger.exception('Live update dispatch failed')
+
+    async def dispatch(self, changes):
+        watched = set(self.subscribers)
+        if not watched:
+            return
+        for update in await self.run_sync(build_updates, changes, watched):
+            topic, key, payload, is_public, owner_id = update
+            if self.last.get(key) == update:
+                continue
+            self.last[key] = update
+            for subscription in self.subscribers.get(topic, ()):
+                subscription.push(topic, key, payload, is_public, owner_id)
+
+class ChangeLogBackend:
+    """Polls the Change table; sees writes from every worker and process."""
+
+    def __init__(self):
+        self.cursor = None
+
+    def read(self):
+        # Import here: sync imports serializers, which must not load at django.setup()
+        from .sync import sync_settings
+
+        close_old_connections()
+        if self.cursor is None:
+            self.cursor = Change.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+            return []
+        rows, _ = Change.objects.settled_after(self.cursor, 1000, sync_settings()['SETTLE_SECONDS'])
+        if rows:
+            self.cursor = rows[-1][0]
+        return [row[1:] for row in rows]
+
+    async def changes(self, hub):
+        interval = live_settings()['POLL_INTERVAL']
+        # Start from now: streams begin with the current values anyway
+        self.cursor = None
+        while True:
+            rows = await hub.run_sync(self.read)
+            if rows:
+                yield rows
+            else:
+                await asyncio.sleep(interval)
+
+class LocalBackend:
+    """In-process stand-in for tests and single-process setups: ``publish()`` feeds the hub directly."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def publish(self, changes):
+        self.queue.put_nowait(list(changes))
+
+    async def changes(self, hub):
+        while True:
+            yield await self.queue.get()
+
+_hub = None
+
+def get_hub():
+    """This worker's hub, created on first use in the running event loop."""
+    global _hub
+    loop = asyncio.get_running_loop()
+    if _hub is None or _hub.loop is not loop:
+        if _hub is not None:
+            _hub.executor.shutdown(wait=False)
+        _hub = Hub(import_string(live_settings()['BACKEND'])())
+        _hub.loop = loop
+    return _hub
+
+def stream_token(user):
+    """A token that lets a stream act as ``user`` for TOKEN_MAX_AGE seconds, and nothing else."""
+    return signing.dumps(user.pk, salt=TOKEN_SALT)
+
+def token_user_id(token):
+    try:
+        user_id = signing.loads(token, salt=TOKEN_SALT, max_age=live_settings()['TOKEN_MAX_AGE'])
+    except signing.BadSignature:
+        raise AuthenticationFailed('Invalid or expired stream token.')
+    if not User.objects.filter(pk=user_id, is_active=True).exists():
+        raise AuthenticationFailed('Invalid or expired stream token.')
+    return user_id
+
+def format_event(payloads):
+    """One SSE frame; a heartbeat comment when ``payloads`` is None."""
+    if payloads is None:
+        return b': ping\n\n'
+    return f'event: update\ndata: {json.dumps(payloads, separators=(",", ":"))}\n\n'.encode()
+
+def open_stream(request):
+    """The user id (from ``?token=``, the JWT cookie or header) and the ids a stream asks for."""
+    request.get_host()
+    token = request.GET.get('token')
+    if token is not None:
+        user_id = token_user_id(token)
+    else:
+        authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        user_id = Request(request, authenticators=authenticators).user.pk
+    snippet_ids, collection_ids = parse_live_params(request.GET)
+    return user_id, snippet_ids, collection_ids
+
+class LiveUpdatesApp:
+    """
+    ASGI app serving the live stream at ``path`` and handing every other
+    request to ``app`` (Django). Streams bypass Django's middleware, which
+    would tie up a thread per open request; an idle stream here is a
+    coroutine waiting on an event.
+    """
+
+    def __init__(self, app, path='/api/live'):
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.app(scope, receive, send)
+
+        request = ASGIRequest(scope, io.BytesIO())
+        headers = [(b'vary', b'origin')]
+        origin = request.headers.get('Origin')
+        if origin in settings.CORS_ALLOWED_ORIGINS:
+            headers.append((b'access-control-allow-origin', origin.encode()))
+        if scope['method'] != 'GET':
+            return await respond(send, 405, {'detail': f'Method "{scope["method"]}" not allowed.'},
+                                 [*headers, (b'allow', b'GET')])
+
+        conf = live_settings()
+        hub = get_hub()
+        if hub.connections >= conf['MAX_CONNECTIONS']:
+            return await respond(send, 503, {'detail': 'Too many open streams; try again later.'},
+                                 [*headers, (b'retry-after', str(conf['RETRY_MS'] // 1000).encode())])
+        try:
+            user_id, snippet_ids, collection_ids = await hub.run_sync(open_stream, request)
+        except DisallowedHost:
+            return await respond(send, 400, {'detail': 'Invalid host.'}, headers)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+            return await respond(send, exc.status_code, detail, headers)
+
+        topics = {(Change.SNIPPET, pk) for pk in snippet_ids} | {(Change.COLLECTION, pk) for pk in collection_ids}
+        # Subscribe before reading the current values so nothing falls in between
+        subscription = hub.subscribe(user_id, topics)
+        try:
+            snapshot, _ = await hub.run_sync(load_updates, snippet_ids, collection_ids)
+            for update in snapshot:
+                # An update that arrived meanwhile is newer than the snapshot
+                if update[1] not in subscription.pending:
+                    subscription.push(*update)
+
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                *headers,
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Tell nginx not to buffer the stream
+                (b'x-accel-buffering', b'no'),
+            ]})
+            await send({'type': 'http.response.body', 'body': f"retry: {conf['RETRY_MS']}\n\n".encode(),
+                        'more_body': True})
+            streaming = asyncio.ensure_future(self.stream(subscription, send))
+            disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+            await asyncio.wait({streaming, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            for future in (streaming, disconnected):
+                future.cancel()
+            # Collect how both ended, so a failed stream is logged rather than lost
+            for result in await asyncio.gather(streaming, disconnected, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.error('Live stream failed', exc_info=result)
+        finally:
+            hub.unsubscribe(subscription)
+
+    async def stream(self, subscription, send):
+        async for payloads in subscription.updates():
+            await send({'type': 'http.response.body', 'body': format_event(payloads), 'more_body': True})
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def respond(send, status, data, headers):
+    body = json.dumps(data).encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        *headers, (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
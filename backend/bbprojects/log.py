@@ -0,0 +1,137 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .instrumentation import QueryTracker
+
+logger = logging.getLogger('bbprojects.requests')
+
+# LogRecord attributes that are not user supplied ``extra`` fields
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+class JSONFormatter(logging.Formatter):
+    """Render a record as one JSON object per line, ``extra`` fields included."""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+class QueuedStreamHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a background thread that writes them to stderr, so request
+    threads never block on stream I/O. The writer thread is restarted in forked
+    children (gunicorn --preload), where it would otherwise be missing.
+    """
+
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.stream_handler = logging.StreamHandler()
+        self._start()
+        atexit.register(self._stop)
+        os.register_at_fork(after_in_child=self._start)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the writer thread, not in the request thread
+        self.stream_handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def _start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.stream_handler)
+        self.listener.start()
+
+    def _stop(self):
+        self.listener.stop()
+
+def _sample_rate():
+    return float(getattr(settings, 'REQUEST_LOG', {}).get('SAMPLE_RATE', 0.0))
+
+class RequestLogMiddleware:
+    """
+    Log route, status, DB query count, DB time and latency of a sample of
+    requests (REQUEST_LOG['SAMPLE_RATE']). With a rate of 0 the middleware
+    removes itself from the stack at startup.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = _sample_rate()
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return (self.sample_rate >= 1 or random.random() < self.sample_rate) \
+            and logger.isEnabledFor(logging.INFO)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            timer = QueryTracker().track(stack)
+            response = self.get_response(request)
+        self.log(request, response, timer, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        # Install the tracker on the thread sync_to_async runs the queries on
+        stack = ExitStack()
+        timer = await sync_to_async(QueryTracker().track)(stack)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.log(request, response, timer, started)
+        return response
+
+    def log(self, request, response, timer, started):
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        logger.info('request', extra={
+            'method': request.method,
+            'route': match.route if match else None,
+            'status': response.status_code,
+            'queries': timer.count,
+            'db_ms': round(timer.duration * 1000, 2),
+            'duration_ms': round(duration * 1000, 2),
+        })
@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from bbprojects.benchmarks import (
+    SCENARIOS, SEED_DEFAULTS, ScenarioError, seed, run_scenario, environment, compare, load_report
+)
+
+class Command(BaseCommand):
+    help = (
+        'Run the benchmark scenarios in-process and report throughput, latency '
+        'percentiles and queries per request as JSON. By default a fresh test '
+        'database is created and seeded on the configured database server '
+        '(in-memory SQLite, or Postgres when DATABASE_URL is set).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma separated subset of: {', '.join(SCENARIOS)}")
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--compare', help='Previous JSON report to compare against.')
+        parser.add_argument('--existing-data', action='store_true',
+                            help='Run against the configured database as is (already seeded with seed_data).')
+        for name, default in SEED_DEFAULTS.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = [n for n in options['scenarios'].split(',') if n]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        old_name = None
+        if not options['existing_data']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            dataset = None
+            if old_name is not None:
+                with transaction.atomic():
+                    dataset = seed(random_seed=options['seed'],
+                                   **{name: options[name] for name in SEED_DEFAULTS})
+            try:
+                report = {
+                    'environment': environment(),
+                    'dataset': dataset,
+                    'iterations': options['iterations'],
+                    'scenarios': {
+                        name: run_scenario(SCENARIOS[name], options['iterations']) for name in names
+                    },
+                }
+            except ScenarioError as e:
+                raise CommandError(e)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['compare']:
+            report['comparison'] = compare(load_report(options['compare']), report)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
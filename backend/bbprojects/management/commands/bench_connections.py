@@ -0,0 +1,52 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from bbprojects.utils import percentile
+
+class Command(BaseCommand):
+    help = (
+        'Measure what a request pays for its database connection: opening (or '
+        'checking out of the pool) a connection and running one query, against '
+        'running the same query on a connection that is already open.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        settings_dict = connection.settings_dict
+        report = {
+            'vendor': connection.vendor,
+            'pool': bool(settings_dict.get('OPTIONS', {}).get('pool')),
+            'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+            'conn_health_checks': settings_dict.get('CONN_HEALTH_CHECKS'),
+            # Closing hands pooled connections back to the pool, so with a pool
+            # this measures a checkout rather than a new server connection
+            'new_or_checked_out_ms': self.measure(connection, options['iterations'], reconnect=True),
+            'reused_ms': self.measure(connection, options['iterations'], reconnect=False),
+        }
+        connection.close()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def measure(self, connection, iterations, reconnect):
+        timings = []
+        connection.ensure_connection()
+        for _ in range(iterations):
+            if reconnect:
+                connection.close()
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            'p50': round(percentile(timings, 50), 3),
+            'p95': round(percentile(timings, 95), 3),
+            'p99': round(percentile(timings, 99), 3),
+        }
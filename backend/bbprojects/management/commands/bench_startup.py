@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bbprojects.utils import percentile
+
+class Command(BaseCommand):
+    help = (
+        'Boot gunicorn with and without --preload (gunicorn.conf.py) and '
+        'compare time to first response, latency of the first requests each '
+        'worker serves, and worker memory (PSS counts shared pages once).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--path', default='/api/snippets/')
+        parser.add_argument('--rounds', type=int, default=3,
+                            help='Boots per configuration; medians are reported.')
+
+    def handle(self, *args, **options):
+        report = {}
+        for name, preload in (('preload', '1'), ('no_preload', '0')):
+            boots = [self.boot(preload, options) for _ in range(options['rounds'])]
+            report[name] = {
+                key: sorted(boot[key] for boot in boots)[len(boots) // 2]
+                for key in boots[0]
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def boot(self, preload, options):
+        base_url = f"http://127.0.0.1:{options['port']}"
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'core.wsgi:application',
+             '--bind', f"127.0.0.1:{options['port']}", '--workers', str(options['workers'])],
+            cwd=settings.BASE_DIR, env={**os.environ, 'GUNICORN_PRELOAD': preload},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    requests.get(base_url + options['path'], timeout=5)
+                    break
+                except requests.ConnectionError:
+                    if time.monotonic() > deadline:
+                        raise CommandError(f"Server did not start on port {options['port']}")
+                    time.sleep(0.02)
+            first_response = time.perf_counter() - started
+
+            # Enough concurrent requests to reach every worker at least once
+            def fetch(_):
+                with requests.Session() as session:
+                    request_started = time.perf_counter()
+                    session.get(base_url + options['path'])
+                    return (time.perf_counter() - request_started) * 1000
+
+            with ThreadPoolExecutor(max_workers=options['workers'] * 2) as pool:
+                latencies = sorted(pool.map(fetch, range(options['workers'] * 4)))
+
+            workers = _children(process.pid)
+            memory = [_memory_kb(pid) for pid in [process.pid, *workers]]
+            return {
+                'first_response_ms': round(first_response * 1000),
+                'first_requests_p50_ms': round(percentile(latencies, 50), 1),
+                'first_requests_max_ms': round(latencies[-1], 1),
+                'workers': len(workers),
+                'rss_total_mb': round(sum(m['Rss'] for m in memory) / 1024, 1),
+                'pss_total_mb': round(sum(m['Pss'] for m in memory) / 1024, 1),
+                'private_per_worker_mb': round(
+                    sum(m['Private_Dirty'] + m['Private_Clean'] for m in memory[1:])
+                    / max(len(workers), 1) / 1024, 1
+                ),
+            }
+        finally:
+            process.terminate()
+            process.wait()
+
+def _children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+def _memory_kb(pid):
+    """Rss/Pss/Private_* of a process in kB, from /proc/<pid>/smaps_rollup (Linux)."""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if rest.strip().endswith('kB'):
+                values[key] = int(rest.split()[0])
+    return values
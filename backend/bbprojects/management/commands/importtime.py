@@ -0,0 +1,78 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Code run by the fresh interpreter: app loading alone, or everything a request needs
+TARGETS = {
+    'setup': 'import django; django.setup()',
+    'urls': 'import django; django.setup(); from django.urls import reverse; reverse("api-root")',
+}
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)$')
+
+class Command(BaseCommand):
+    help = (
+        'Profile cold-start imports with python -X importtime: the slowest '
+        'modules by cumulative and self time, and the median wall time of a '
+        'fresh interpreter reaching the target.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=TARGETS, default='urls',
+                            help='"setup" stops after django.setup(); "urls" also loads the URLconf.')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Cold starts to time for the wall-clock median.')
+        parser.add_argument('--first-party', action='store_true',
+                            help='Only list bbprojects and core modules.')
+
+    def handle(self, *args, **options):
+        code = TARGETS[options['target']]
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings')}
+
+        profile = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        modules = []
+        for line in profile.stderr.splitlines():
+            match = LINE.match(line)
+            if match:
+                own, cumulative, name = match.groups()
+                modules.append({
+                    'module': name,
+                    'self_ms': int(own) / 1000,
+                    'cumulative_ms': int(cumulative) / 1000,
+                })
+
+        listed = modules
+        if options['first_party']:
+            listed = [m for m in modules if m['module'].split('.')[0] in ('bbprojects', 'core')]
+
+        wall = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, check=True)
+            wall.append((time.perf_counter() - started) * 1000)
+
+        def slowest(key):
+            return [
+                {'module': m['module'], 'ms': round(m[key], 2)}
+                for m in sorted(listed, key=lambda m: m[key], reverse=True)[:options['top']]
+            ]
+
+        self.stdout.write(json.dumps({
+            'target': options['target'],
+            'wall_ms_median': round(statistics.median(wall), 1),
+            'modules_imported': len(modules),
+            'import_ms_total': round(sum(m['self_ms'] for m in modules), 1),
+            'slowest_cumulative': slowest('cumulative_ms'),
+            'slowest_self': slowest('self_ms'),
+        }, indent=2))
@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bbprojects.utils import percentile
+
+MODES = {
+    'wsgi': {
+        'app': 'core.wsgi:application',
+        'args': ['--worker-class', 'sync'],
+        'env': {'ASYNC_READ_VIEWS': '0'},
+    },
+    'asgi': {
+        'app': 'core.asgi:application',
+        'args': ['--worker-class', 'uvicorn_worker.UvicornWorker'],
+        'env': {'ASYNC_READ_VIEWS': '1'},
+    },
+}
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the read endpoints over HTTP. Without --url, boots gunicorn '
+        'once per deployment mode (WSGI and ASGI) and compares them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of an already running server.')
+        parser.add_argument('--paths', default='/api/snippets/,/api/collections/',
+                            help='Comma separated paths to request in turn.')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--token', help='JWT access token for authenticated paths.')
+        parser.add_argument('--modes', default='wsgi,asgi')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        paths = [p for p in options['paths'].split(',') if p]
+        if options['url']:
+            report = self.run_load(options['url'], paths, options)
+        else:
+            report = {}
+            for mode in options['modes'].split(','):
+                if mode not in MODES:
+                    raise CommandError(f'Unknown mode: {mode}')
+                with self.serve(mode, options) as base_url:
+                    report[mode] = self.run_load(base_url, paths, options)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def serve(self, mode, options):
+        return _Server(mode, options['port'], options['workers'])
+
+    def run_load(self, base_url, paths, options):
+        local = threading.local()
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+
+        def fetch(i):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            started = time.perf_counter()
+            response = session.get(base_url + paths[i % len(paths)], headers=headers)
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(r[0] * 1000 for r in results)
+        return {
+            'requests': len(results),
+            'errors': sum(1 for r in results if r[1] >= 400),
+            'throughput_rps': round(len(results) / elapsed, 1),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+            },
+        }
+
+class _Server:
+    def __init__(self, mode, port, workers):
+        self.mode = MODES[mode]
+        self.port = port
+        self.workers = workers
+        self.base_url = f'http://127.0.0.1:{port}'
+
+    def __enter__(self):
+        env = {**os.environ, **self.mode['env']}
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', self.mode['app'],
+             '--bind', f'127.0.0.1:{self.port}', '--workers', str(self.workers),
+             *self.mode['args']],
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                requests.get(self.base_url + '/api/', timeout=1)
+                return self.base_url
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        self.process.terminate()
+        raise CommandError(f'Server did not start on port {self.port}')
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait()
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bbprojects.models import Change
+from bbprojects.sync import sync_settings
+
+class Command(BaseCommand):
+    help = (
+        'Prune the sync change log to SYNC_CHANGES["RETENTION_DAYS"]. The newest '
+        'pruned entry is kept as the horizon: clients holding an older token '
+        'get a 410 and resync from scratch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Retention in days (default from settings).')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else sync_settings()['RETENTION_DAYS']
+        cutoff = timezone.now() - timedelta(days=days)
+        horizon = (
+            Change.objects.filter(created_at__lt=cutoff)
+            .order_by('-seq').values_list('seq', flat=True).first()
+        )
+        deleted = 0
+        if horizon is not None:
+            # Short DELETEs over seq ranges rather than one long one
+            while True:
+                batch = list(
+                    Change.objects.filter(seq__lt=horizon).order_by('seq')
+                    .values_list('seq', flat=True)[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                deleted += Change.objects.filter(seq__gte=batch[0], seq__lte=batch[-1]).delete()[0]
+        message = f'Deleted {deleted} change log entries'
+        if horizon is not None:
+            message += f'; tokens below {horizon - 1} now get a 410'
+        self.stdout.write(message)
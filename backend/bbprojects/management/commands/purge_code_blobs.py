@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from bbprojects.models import CodeBlob
+
+class Command(BaseCommand):
+    help = 'Delete code blobs no snippet refers to any more (left behind by deleted or edited snippets).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        orphans = CodeBlob.objects.unreferenced()
+        if options['dry_run']:
+            self.stdout.write(f'{orphans.count()} unreferenced code blobs')
+            return
+        deleted, _ = orphans.delete()
+        self.stdout.write(f'Deleted {deleted} unreferenced code blobs')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from bbprojects.deletion import MODELS, purge
+
+class Command(BaseCommand):
+    help = (
+        'Purge users, snippets and collections that were deleted but not purged '
+        'yet (normally the purge_deleted task does this), reporting progress '
+        'batch by batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Rows deleted per transaction (default DELETION['BATCH_SIZE']).")
+        parser.add_argument('--dry-run', action='store_true', help='Only list what is waiting.')
+
+    def handle(self, *args, **options):
+        pending = []
+        for name, model in MODELS.items():
+            queryset = model.all_objects.filter(deleted_at__isnull=False)
+            if name != 'user':
+                # Purged along with their owner
+                queryset = queryset.filter(owner__deleted_at__isnull=True)
+            pending += [(name, pk) for pk in queryset.order_by('pk').values_list('pk', flat=True)]
+
+        self.stdout.write(f'{len(pending)} deleted objects waiting to be purged')
+        if options['dry_run']:
+            return
+
+        for name, pk in pending:
+            def progress(step, rows, total):
+                self.stdout.write(f'{name} {pk}: {total} {step} deleted')
+            purge(name, pk, options['batch_size'], progress=progress)
+            self.stdout.write(f'{name} {pk}: done')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bbprojects.models import Snippet, Collection
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the stored counters (Snippet.likes_count, Collection.snippet_count) '
+        'from the relation tables, in primary key ranges so no single UPDATE '
+        'locks the whole table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.rebuild(Snippet.objects.all(), 'refresh_likes_count', 'snippet likes', options['batch_size'])
+        self.rebuild(Collection.objects.all(), 'refresh_snippet_count', 'collection snippets', options['batch_size'])
+
+    def rebuild(self, queryset, method, label, batch_size):
+        ids = queryset.order_by('pk').values_list('pk', flat=True)
+        last_pk, updated = 0, 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += getattr(queryset.model.objects.filter(pk__in=batch), method)()
+            last_pk = batch[-1]
+        self.stdout.write(f'Recounted {label} of {updated} rows')
@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from bbprojects.models import SearchSuggestion
+from bbprojects.suggest import SOURCES, source_rows, invalidate_all_suggestions
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the typeahead table (SearchSuggestion) from users, collections '
+        'and snippets. Rows are upserted in batches, so suggestions keep working '
+        'meanwhile; rows of deleted objects are removed at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for kind, (label, *_) in SOURCES.items():
+            model = apps.get_model(label)
+            written = 0
+            for rows in source_rows(kind, model, options['batch_size']):
+                SearchSuggestion.objects.index(rows)
+                written += len(rows)
+            removed, _ = SearchSuggestion.objects.filter(kind=kind).exclude(
+                object_id__in=model.objects.values('pk')
+            ).delete()
+            self.stdout.write(f'{kind}: {written} written, {removed} removed')
+        invalidate_all_suggestions()
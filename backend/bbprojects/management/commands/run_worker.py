@@ -0,0 +1,53 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from bbprojects.tasks import claim, run_claimed, run_pending
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks (bbprojects.tasks) from the Task table. '
+        'Each thread claims a batch of due tasks of one name at a time; '
+        'several workers can run side by side.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2,
+                            help='Batches run at the same time, each on its own DB connection.')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Tasks claimed at once (default BACKGROUND_TASKS['BATCH_SIZE']).")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when no task is due.')
+        parser.add_argument('--once', action='store_true',
+                            help='Run everything that is due, then exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.stdout.write(f"Ran {run_pending(options['batch_size'])} tasks")
+            return
+
+        stopping = threading.Event()
+        # Finish the batches in hand, then exit
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        def loop():
+            try:
+                while not stopping.is_set():
+                    close_old_connections()
+                    batch = claim(options['batch_size'])
+                    if batch is None:
+                        stopping.wait(options['poll_interval'])
+                    else:
+                        run_claimed(*batch)
+            finally:
+                connections.close_all()
+
+        self.stdout.write(f"Worker started with {options['threads']} threads")
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            for future in [pool.submit(loop) for _ in range(options['threads'])]:
+                future.result()
+        self.stdout.write('Worker stopped')
@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bbprojects.benchmarks import SEED_DEFAULTS, seed
+
+class Command(BaseCommand):
+    help = 'Seed configurable volumes of users, snippets, likes and collections for benchmarks.'
+
+    def add_arguments(self, parser):
+        for name, default in SEED_DEFAULTS.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible data.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = seed(random_seed=options['seed'], **{name: options[name] for name in SEED_DEFAULTS})
+        self.stdout.write(json.dumps(counts))
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0003_collection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('compressed', models.BooleanField(default=False)),
+                ('size', models.PositiveIntegerField(help_text='Length of the uncompressed UTF-8 text in bytes.')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='code_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='snippets', to='bbprojects.codeblob'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:14
+
+import hashlib
+import zlib
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+# Frozen copy of bbprojects.blobs as it stood for this migration, so later
+# edits there cannot change how existing rows were moved
+COMPRESS_MIN_SIZE = 512
+COMPRESS_LEVEL = 6
+
+def encode(text):
+    raw = text.encode()
+    data, compressed = raw, False
+    if len(raw) >= COMPRESS_MIN_SIZE:
+        packed = zlib.compress(raw, COMPRESS_LEVEL)
+        if len(packed) < len(raw):
+            data, compressed = packed, True
+    return hashlib.sha256(raw).hexdigest(), data, compressed, len(raw)
+
+def decode(data, compressed):
+    data = bytes(data)
+    return (zlib.decompress(data) if compressed else data).decode()
+
+def move_code_to_blobs(apps, schema_editor):
+    """Copy every snippet's code_content into a deduplicated CodeBlob, one batch per transaction."""
+    Snippet = apps.get_model('bbprojects', 'Snippet')
+    CodeBlob = apps.get_model('bbprojects', 'CodeBlob')
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        rows = list(
+            Snippet.objects.using(db).filter(pk__gt=last_pk, code_blob__isnull=True)
+            .order_by('pk').values_list('pk', 'code_content')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        blobs, snippets = {}, []
+        for pk, code in rows:
+            key, data, compressed, size = encode(code)
+            blobs[key] = CodeBlob(digest=key, data=data, compressed=compressed, size=size)
+            snippets.append(Snippet(pk=pk, code_blob_id=key))
+        with transaction.atomic(using=db):
+            CodeBlob.objects.using(db).bulk_create(blobs.values(), ignore_conflicts=True)
+            Snippet.objects.using(db).bulk_update(snippets, ['code_blob'])
+        last_pk = rows[-1][0]
+
+def move_code_back(apps, schema_editor):
+    Snippet = apps.get_model('bbprojects', 'Snippet')
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        rows = list(
+            Snippet.objects.using(db).filter(pk__gt=last_pk)
+            .order_by('pk').values_list('pk', 'code_blob__data', 'code_blob__compressed')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        snippets = [Snippet(pk=pk, code_content=decode(data, compressed)) for pk, data, compressed in rows]
+        with transaction.atomic(using=db):
+            Snippet.objects.using(db).bulk_update(snippets, ['code_content'])
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so a large table is not locked for the whole move
+    atomic = False
+
+    dependencies = [
+        ('bbprojects', '0004_codeblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_code_to_blobs, move_code_back),
+    ]
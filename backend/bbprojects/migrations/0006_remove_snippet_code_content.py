@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0005_move_code_to_blobs'),
+    ]
+
+    operations = [
+        # Lets the column be re-added to existing rows when migrating backwards
+        migrations.AlterField(
+            model_name='snippet',
+            name='code_content',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='code_content',
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='code_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='snippets', to='bbprojects.codeblob'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-19 01:17
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+def count_likes(apps, schema_editor):
+    Snippet = apps.get_model('bbprojects', 'Snippet')
+    Like = Snippet.likes.through
+    like_count = (
+        Like.objects.filter(snippet_id=OuterRef('pk'))
+        .order_by().values('snippet_id').annotate(total=Count('*')).values('total')
+    )
+    Snippet.objects.using(schema_editor.connection.alias).update(
+        likes_count=Coalesce(Subquery(like_count), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0006_remove_snippet_code_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='likes_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+def count_snippets(apps, schema_editor):
+    Collection = apps.get_model('bbprojects', 'Collection')
+    Membership = Collection.snippets.through
+    snippet_count = (
+        Membership.objects.filter(collection_id=OuterRef('pk'))
+        .order_by().values('collection_id').annotate(total=Count('*')).values('total')
+    )
+    Collection.objects.using(schema_editor.connection.alias).update(
+        snippet_count=Coalesce(Subquery(snippet_count), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0007_snippet_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='snippet_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_snippets, migrations.RunPython.noop),
+    ]
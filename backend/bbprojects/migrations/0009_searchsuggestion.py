@@ -0,0 +1,83 @@
+# Generated by Django 5.1.4 on 2026-10-19 01:23
+
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Frozen copy of bbprojects.suggest as it stood for this migration, so later
+# edits there cannot change the rows it writes
+KEY_LENGTH = 200
+
+SOURCES = {
+    'user': ('bbprojects.User', 'username', 'pk'),
+    'collection': ('bbprojects.Collection', 'name', 'owner_id'),
+    'snippet': ('bbprojects.Snippet', 'title', 'owner_id'),
+}
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())[:KEY_LENGTH]
+
+def create_prefix_index(apps, schema_editor):
+    # Byte order on every database: Postgres collations would otherwise keep
+    # the index from serving the prefix range and its ORDER BY
+    key = '"key" COLLATE "C"' if schema_editor.connection.vendor == 'postgresql' else '"key"'
+    schema_editor.execute(
+        f'CREATE INDEX suggestion_key ON bbprojects_searchsuggestion ({key}, "kind", "object_id")'
+    )
+
+def fill_suggestions(apps, schema_editor):
+    SearchSuggestion = apps.get_model('bbprojects', 'SearchSuggestion')
+    db = schema_editor.connection.alias
+    for kind, (label, label_field, owner_field) in SOURCES.items():
+        rows = (
+            apps.get_model(label).objects.using(db).order_by('pk')
+            .values_list('pk', label_field, 'is_public', owner_field)
+        )
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            if not batch:
+                break
+            SearchSuggestion.objects.using(db).bulk_create([
+                SearchSuggestion(
+                    kind=kind, object_id=pk, label=text, key=normalize(text),
+                    is_public=is_public, owner_id=owner_id,
+                )
+                for pk, text, is_public, owner_id in batch
+            ])
+            last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0008_collection_snippet_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'User'), ('collection', 'Collection'), ('snippet', 'Snippet')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('label', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200)),
+                ('is_public', models.BooleanField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, db_index=False, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'key'], name='suggestion_owner_key')],
+                'constraints': [models.UniqueConstraint(fields=('object_id', 'kind'), name='suggestion_unique_object')],
+            },
+        ),
+        # Reversing CreateModel drops the table and the index with it
+        migrations.RunPython(create_prefix_index, migrations.RunPython.noop),
+        migrations.RunPython(fill_suggestions, migrations.RunPython.noop),
+    ]
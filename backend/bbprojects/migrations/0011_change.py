@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-19 01:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0010_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('snippet', 'Snippet'), ('collection', 'Collection'), ('membership', 'Membership'), ('like', 'Like')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('related_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
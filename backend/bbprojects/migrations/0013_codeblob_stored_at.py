@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0012_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeblob',
+            name='stored_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When a snippet last stored this body.'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# (index name, table, column) for the admin's '^' and '=' searches, which
+# compile to istartswith and iexact
+SEARCH_INDEXES = [
+    ('snippet_title_search', 'bbprojects_snippet', 'title'),
+    ('collection_name_search', 'bbprojects_collection', 'name'),
+    ('user_username_search', 'bbprojects_user', 'username'),
+    ('user_email_search', 'bbprojects_user', 'email'),
+]
+
+def index_expression(vendor, column):
+    if vendor == 'postgresql':
+        # Matches the UPPER("column"::text) LIKE UPPER(...) Django writes;
+        # text_pattern_ops serves prefixes whatever the database collation
+        return f'UPPER("{column}"::text) text_pattern_ops'
+    if vendor == 'sqlite':
+        # SQLite's LIKE is case-insensitive and uses a NOCASE index for prefixes
+        return f'"{column}" COLLATE NOCASE'
+    return None
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for name, table, column in SEARCH_INDEXES:
+        expression = index_expression(vendor, column)
+        if expression is not None:
+            schema_editor.execute(f'CREATE INDEX {name} ON {table} ({expression})')
+
+def drop_search_indexes(apps, schema_editor):
+    if index_expression(schema_editor.connection.vendor, '') is None:
+        return
+    for name, _, _ in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbprojects', '0013_codeblob_stored_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
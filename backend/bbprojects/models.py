@@ -1,5 +1,27 @@
-from django.contrib.auth.models import AbstractUser
+from datetime import timedelta
+
+from django.apps import apps
+from django.contrib.auth.models import AbstractUser, UserManager as AuthUserManager
 from django.db import models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .blobs import blob_settings, encode, decode
+from .suggest import KEY_LENGTH, SOURCES, suggestion_fields
+
+class NotDeletedManagerMixin:
+    """
+    Leave out rows marked deleted and waiting to be purged (see
+    bbprojects.deletion). Models keep an unfiltered ``all_objects`` manager.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+class UserManager(NotDeletedManagerMixin, AuthUserManager):
+    pass
 
 class User(AbstractUser):
     date_of_birth = models.DateField(null=True, blank=True)
@@ -9,10 +31,77 @@ class User(AbstractUser):
     avatar = models.URLField(max_length=200, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set by deletion.soft_delete(); the row and everything it owns go later
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = UserManager()
+    all_objects = AuthUserManager()
 
     def __str__(self):
         return self.username
 
+class CodeBlobManager(models.Manager):
+    def store(self, text):
+        """
+        The blob holding ``text``; inserted unless an identical body is already
+        stored, in which case its ``stored_at`` is bumped so unreferenced()
+        leaves it alone until the caller's snippet points at it.
+        """
+        key, data, compressed, size = encode(text)
+        blob = CodeBlob(digest=key, data=data, compressed=compressed, size=size)
+        self.bulk_create([blob], update_conflicts=True, unique_fields=['digest'], update_fields=['stored_at'])
+        return blob
+
+    def unreferenced(self):
+        """Blobs no snippet uses, left out while within CODE_BLOBS['PURGE_GRACE_SECONDS'] of being stored."""
+        grace = timedelta(seconds=blob_settings()['PURGE_GRACE_SECONDS'])
+        return self.filter(snippets__isnull=True, stored_at__lte=timezone.now() - grace)
+
+class CodeBlob(models.Model):
+    """
+    A snippet's code body, keyed by the SHA-256 of its text so identical code
+    (forks, copies) is stored once. Bodies above CODE_BLOBS['COMPRESS_MIN_SIZE']
+    are zlib-compressed.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    compressed = models.BooleanField(default=False)
+    size = models.PositiveIntegerField(help_text='Length of the uncompressed UTF-8 text in bytes.')
+    stored_at = models.DateTimeField(default=timezone.now, help_text='When a snippet last stored this body.')
+
+    objects = CodeBlobManager()
+
+    def __str__(self):
+        return self.digest
+
+    @cached_property
+    def text(self):
+        return decode(self.data, self.compressed)
+
+class SnippetQuerySet(models.QuerySet):
+    def with_like_info(self, user=None):
+        """
+        Annotate ``liked_by_user`` so serializing a page of snippets does not
+        run a like query per row; the count is the stored ``likes_count``.
+        """
+        if user is not None and user.is_authenticated:
+            liked = Exists(Snippet.likes.through.objects.filter(snippet_id=OuterRef('pk'), user_id=user.pk))
+        else:
+            liked = Value(False)
+        return self.annotate(liked_by_user=liked)
+
+    def refresh_likes_count(self):
+        """Recompute the stored ``likes_count`` of these snippets in one UPDATE."""
+        like_count = (
+            Snippet.likes.through.objects.filter(snippet_id=OuterRef('pk'), user__deleted_at__isnull=True)
+            .order_by().values('snippet_id').annotate(total=Count('*')).values('total')
+        )
+        return self.update(likes_count=Coalesce(Subquery(like_count), 0))
+
+class SnippetManager(NotDeletedManagerMixin, models.Manager.from_queryset(SnippetQuerySet)):
+    pass
+
 class Snippet(models.Model):
     LANGUAGE_CHOICES = [
         ('python', 'Python'),
@@ -24,7 +113,7 @@ class Snippet(models.Model):
     ]
 
     title = models.CharField(max_length=200)
-    code_content = models.TextField()
+    code_blob = models.ForeignKey(CodeBlob, on_delete=models.PROTECT, related_name='snippets')
     language = models.CharField(max_length=20, choices=LANGUAGE_CHOICES)
     description = models.TextField(blank=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='snippets')
@@ -32,6 +121,12 @@ class Snippet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name='liked_snippets', blank=True)
+    # Kept in step with ``likes`` by signals; rebuild with manage.py rebuild_counters
+    likes_count = models.PositiveIntegerField(default=0, db_index=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = SnippetManager()
+    all_objects = SnippetQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
@@ -39,6 +134,47 @@ class Snippet(models.Model):
     def __str__(self):
         return f"{self.title} by {self.owner.username}"
 
+    @property
+    def code_content(self):
+        """The code body; assigning it stores a (deduplicated) CodeBlob on save()."""
+        pending = self.__dict__.get('_pending_code')
+        if pending is not None:
+            return pending
+        if self.code_blob_id is None:
+            return ''
+        return self.code_blob.text
+
+    @code_content.setter
+    def code_content(self, value):
+        self.__dict__['_pending_code'] = value
+
+    def save(self, *args, **kwargs):
+        pending = self.__dict__.get('_pending_code')
+        if pending is None and self.code_blob_id is None:
+            # Snippets created without code get an empty body, as before blobs
+            pending = ''
+        if pending is not None:
+            self.code_blob = CodeBlob.objects.store(pending)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'code_content' in update_fields:
+                kwargs['update_fields'] = [
+                    'code_blob' if name == 'code_content' else name for name in update_fields
+                ]
+        super().save(*args, **kwargs)
+        self.__dict__.pop('_pending_code', None)
+
+class CollectionQuerySet(models.QuerySet):
+    def refresh_snippet_count(self):
+        """Recompute the stored ``snippet_count`` of these collections in one UPDATE."""
+        snippet_count = (
+            Collection.snippets.through.objects.filter(collection_id=OuterRef('pk'), snippet__deleted_at__isnull=True)
+            .order_by().values('collection_id').annotate(total=Count('*')).values('total')
+        )
+        return self.update(snippet_count=Coalesce(Subquery(snippet_count), 0))
+
+class CollectionManager(NotDeletedManagerMixin, models.Manager.from_queryset(CollectionQuerySet)):
+    pass
+
 class Collection(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -47,9 +183,173 @@ class Collection(models.Model):
     is_public = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Kept in step with ``snippets`` by signals; rebuild with manage.py rebuild_counters
+    snippet_count = models.PositiveIntegerField(default=0, db_index=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = CollectionManager()
+    all_objects = CollectionQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return f"{self.name} by {self.owner.username}"
+
+# Columns of a SearchSuggestion row compared against suggest.suggestion_fields
+SUGGESTION_COLUMNS = ('kind', 'object_id', 'label', 'key', 'is_public', 'owner_id')
+
+class SearchSuggestionManager(models.Manager):
+    def sync(self, kind, object_ids):
+        """
+        Bring the suggestion rows of these objects up to date: one upsert for
+        the ones whose text, visibility or owner changed, one DELETE for the
+        ones that no longer exist. Returns the keys whose cached results are
+        now stale.
+        """
+        label, label_field, owner_field = SOURCES[kind]
+        sources = apps.get_model(label).objects.filter(pk__in=object_ids).values_list(
+            'pk', label_field, 'is_public', owner_field
+        )
+        wanted = {row[0]: suggestion_fields(kind, *row) for row in sources}
+        current = {
+            row['object_id']: row
+            for row in self.filter(kind=kind, object_id__in=object_ids).values(*SUGGESTION_COLUMNS)
+        }
+        changed = [fields for pk, fields in wanted.items() if current.get(pk) != fields]
+        gone = [pk for pk in current if pk not in wanted]
+        if changed:
+            self.index(changed)
+        if gone:
+            self.filter(kind=kind, object_id__in=gone).delete()
+        return [fields['key'] for fields in changed] + [
+            current[pk]['key'] for pk in [*gone, *(fields['object_id'] for fields in changed)] if pk in current
+        ]
+
+    def index(self, rows):
+        """Insert or update the rows for a list of ``suggest.suggestion_fields`` dicts."""
+        return self.bulk_create(
+            [SearchSuggestion(**fields) for fields in rows], update_conflicts=True,
+            unique_fields=['object_id', 'kind'], update_fields=['label', 'key', 'is_public', 'owner'],
+        )
+
+class SearchSuggestion(models.Model):
+    """
+    Typeahead entry for a user, collection or snippet: its display text and
+    that text normalized (see suggest.normalize), matched by prefix.
+    Maintained by signals; rebuild with manage.py rebuild_suggestions.
+    """
+
+    KIND_CHOICES = [(kind, kind.capitalize()) for kind in SOURCES]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    label = models.CharField(max_length=200)
+    key = models.CharField(max_length=KEY_LENGTH)
+    is_public = models.BooleanField()
+    # Indexed by suggestion_owner_key
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+
+    objects = SearchSuggestionManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['object_id', 'kind'], name='suggestion_unique_object'),
+        ]
+        indexes = [
+            # The prefix index on (key, kind, object_id) is created by migration
+            # 0009, with key COLLATE "C" on Postgres (see suggest.key_expression)
+            models.Index(fields=['owner', 'key'], name='suggestion_owner_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}: {self.label}'
+
+class Task(models.Model):
+    """
+    Deferred work, run by manage.py run_worker after the transaction that
+    enqueued it commits (see tasks.py). Done tasks are deleted; ones out of
+    attempts stay behind as FAILED.
+    """
+
+    QUEUED, FAILED = 'queued', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Set while a worker holds the task; a crashed worker's tasks are retried once it passes
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+class ChangeManager(models.Manager):
+    def record(self, kind, keys, deleted=False):
+        """
+        Append one entry per key to the sync log: an object id for snippets and
+        collections, a ``(first id, second id)`` pair for memberships and likes.
+        """
+        return self.bulk_create([
+            Change(kind=kind, object_id=key[0], related_id=key[1], deleted=deleted)
+            if isinstance(key, tuple) else Change(kind=kind, object_id=key, deleted=deleted)
+            for key in keys
+        ], batch_size=1000)
+
+    def settled_after(self, since, limit, settle_seconds):
+        """
+        Up to ``limit`` ``(seq, kind, object_id, related_id, deleted)`` rows
+        after ``since``, oldest first, and whether more may follow. Stops at the
+        first entry younger than ``settle_seconds``: a transaction that took an
+        earlier seq may not have committed yet, and reading past it would skip it.
+
+        This is best-effort. Seqs are handed out when rows are inserted, not
+        when they commit, so an entry whose transaction stays open for longer
+        than ``settle_seconds`` after recording it becomes visible behind
+        tokens already given out, and clients past it never see it.
+        """
+        settle_before = timezone.now() - timedelta(seconds=settle_seconds)
+        rows = list(
+            self.filter(seq__gt=since).order_by('seq')
+            .values_list('seq', 'kind', 'object_id', 'related_id', 'deleted', 'created_at')[:limit]
+        )
+        has_more = len(rows) == limit
+        for index, row in enumerate(rows):
+            if row[5] > settle_before:
+                rows, has_more = rows[:index], False
+                break
+        return [row[:5] for row in rows], has_more
+
+class Change(models.Model):
+    """
+    Entry of the change log behind /api/sync/changes: which object (or
+    membership/like pair) changed, and whether it is gone. ``seq`` is the
+    sync token. Entries older than SYNC_CHANGES['RETENTION_DAYS'] are pruned
+    by manage.py purge_changes.
+    """
+
+    SNIPPET, COLLECTION, MEMBERSHIP, LIKE = 'snippet', 'collection', 'membership', 'like'
+    KIND_CHOICES = [(SNIPPET, 'Snippet'), (COLLECTION, 'Collection'), (MEMBERSHIP, 'Membership'), (LIKE, 'Like')]
+
+    seq = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Snippet or collection id; for memberships the collection, for likes the snippet
+    object_id = models.PositiveBigIntegerField()
+    # For memberships the snippet, for likes the user
+    related_id = models.PositiveBigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = ChangeManager()
+
+    def __str__(self):
+        return f'#{self.seq} {self.kind} {self.object_id}'
@@ -0,0 +1,34 @@
+import logging
+from rest_framework import serializers
+from dj_rest_auth.registration.serializers import RegisterSerializer
+
+logger = logging.getLogger(__name__)
+
+class CustomRegisterSerializer(RegisterSerializer):
+    date_of_birth = serializers.DateField(required=False, allow_null=True)
+    bio = serializers.CharField(max_length=160, required=False, allow_blank=True)
+    location = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    is_public = serializers.BooleanField(default=True, required=False)
+
+    def get_cleaned_data(self):
+        data = super().get_cleaned_data()
+        data.update({
+            'date_of_birth': self.validated_data.get('date_of_birth', None),
+            'bio': self.validated_data.get('bio', ''),
+            'location': self.validated_data.get('location', ''),
+            'is_public': self.validated_data.get('is_public', True),
+        })
+        return data
+
+    def save(self, request):
+        user = super().save(request)
+        cleaned_data = self.get_cleaned_data()
+        
+        user.bio = cleaned_data.get('bio', '')
+        user.location = cleaned_data.get('location', '')
+        user.date_of_birth = cleaned_data.get('date_of_birth')
+        user.is_public = cleaned_data.get('is_public', True)
+        user.save()
+        
+        logger.debug("Registered user %s", user.pk)
+        return user
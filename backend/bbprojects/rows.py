@@ -0,0 +1,84 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
+from rest_framework import serializers
+
+# Fields whose to_representation() returns database values unchanged
+_PASSTHROUGH = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+
+class RowMapper:
+    """
+    Build the dicts a ModelSerializer would return straight from ``.values()``
+    rows. Field converters are compiled once from the serializer's fields;
+    nested serializers read ``<source>__<field>`` columns, method fields read
+    the annotation named in ``methods`` and ``computed`` fields are built by a
+    function from several columns (``{name: (columns, function)}``).
+    """
+
+    def __init__(self, serializer_class, methods=None, computed=None):
+        self.serializer_class = serializer_class
+        self.methods = methods or {}
+        self.computed = computed or {}
+
+    @cached_property
+    def compiled(self):
+        return self._compile(self.serializer_class(), '')
+
+    @property
+    def columns(self):
+        """Column names to pass to ``.values()``."""
+        return self.compiled[0]
+
+    def _compile(self, serializer, prefix):
+        columns, mappers = [], []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in self.computed:
+                sources, function = self.computed[name]
+                sources = [f'{prefix}{column}' for column in sources]
+                columns.extend(sources)
+                mappers.append((name, _computed(sources, function)))
+            elif isinstance(field, serializers.BaseSerializer):
+                if isinstance(field, serializers.ListSerializer):
+                    raise ImproperlyConfigured(f'{name}: many=True fields cannot be read from rows')
+                nested_columns, nested_mappers = self._compile(field, f'{prefix}{field.source}__')
+                pk_column = f'{prefix}{field.source}__{field.Meta.model._meta.pk.name}'
+                if pk_column not in nested_columns:
+                    nested_columns.append(pk_column)
+                columns.extend(nested_columns)
+                mappers.append((name, _nested(pk_column, nested_mappers)))
+            elif isinstance(field, serializers.SerializerMethodField):
+                if name not in self.methods:
+                    raise ImproperlyConfigured(f'{name}: map the method field to an annotation')
+                column = self.methods[name]
+                columns.append(column)
+                mappers.append((name, _column(column, None)))
+            else:
+                column = f'{prefix}{field.source.replace(".", "__")}'
+                columns.append(column)
+                convert = None if isinstance(field, _PASSTHROUGH) else field.to_representation
+                mappers.append((name, _column(column, convert)))
+        return columns, mappers
+
+    def map(self, rows):
+        mappers = self.compiled[1]
+        return [{name: get(row) for name, get in mappers} for row in rows]
+
+def _column(column, convert):
+    if convert is None:
+        return lambda row: row[column]
+
+    def get(row):
+        value = row[column]
+        return None if value is None else convert(value)
+    return get
+
+def _computed(columns, function):
+    return lambda row: function(*[row[column] for column in columns])
+
+def _nested(pk_column, mappers):
+    def get(row):
+        if row[pk_column] is None:
+            return None
+        return {name: get_field(row) for name, get_field in mappers}
+    return get
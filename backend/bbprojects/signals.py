@@ -0,0 +1,149 @@
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import User, Snippet, Collection, SearchSuggestion, Change
+from .suggest import SOURCES, kind_of, normalize, invalidate_suggestions
+from .tasks import enqueue
+
+M2M_CHANGES = ('post_add', 'post_remove', 'post_clear')
+
+# Fields a SearchSuggestion row is built from
+SUGGESTION_FIELDS = {'username', 'name', 'title', 'is_public', 'owner'}
+
+def invalidate_activity_feeds(*user_ids, snippet_ids=(), profile_ids=()):
+    # feeds imports DRF and the serializers; keep them out of app loading
+    from .feeds import invalidate_activity_feeds
+    invalidate_activity_feeds(*user_ids, snippet_ids=snippet_ids, profile_ids=profile_ids)
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    invalidate_activity_feeds(instance.pk, profile_ids=[instance.pk])
+
+@receiver([post_save, post_delete], sender=Snippet)
+@receiver([post_save, post_delete], sender=Collection)
+def owned_object_changed(sender, instance, signal, **kwargs):
+    # Other users' feeds show snippets they liked or collected
+    invalidate_activity_feeds(instance.owner_id, snippet_ids=[instance.pk] if sender is Snippet else ())
+    # Memberships and likes that go with a deleted object by cascade are not
+    # logged; sync clients drop them along with the object
+    Change.objects.record(sender._meta.model_name, [instance.pk], deleted=signal is post_delete)
+
+def add_likes(snippet_ids, delta):
+    """
+    Move the stored likes_count of ``snippet_ids`` by ``delta`` in one UPDATE.
+    A full recount per like would scan the snippet's likes every time; drift
+    is fixed by ``manage.py rebuild_counters``.
+    """
+    Snippet.all_objects.filter(pk__in=snippet_ids).update(
+        likes_count=Greatest(F('likes_count') + delta, Value(0))
+    )
+    # Sync clients and the feeds showing these snippets pick up the new counts
+    Change.objects.record(Change.SNIPPET, snippet_ids)
+    invalidate_activity_feeds(snippet_ids=snippet_ids)
+
+def changed_ids(sender, instance, action, model, pk_set):
+    """
+    Ids of the ``model`` rows a ``post_*`` m2m_changed action linked or
+    unlinked, or None for other actions. For clears they are looked up at
+    ``pre_clear``, while the rows still exist.
+    """
+    if action == 'pre_clear':
+        source = next(f.name for f in sender._meta.fields if f.is_relation and f.related_model is not model)
+        target = next(f.attname for f in sender._meta.fields if f.is_relation and f.related_model is model)
+        instance.__dict__.setdefault('_m2m_cleared', {})[sender] = list(
+            sender.objects.filter(**{source: instance.pk}).values_list(target, flat=True)
+        )
+        return None
+    if action == 'post_clear':
+        return instance.__dict__.get('_m2m_cleared', {}).pop(sender, []) or None
+    if action in M2M_CHANGES and pk_set:
+        return list(pk_set)
+    return None
+
+@receiver(m2m_changed, sender=Snippet.likes.through)
+def likes_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Keep likes_count in step; a like shows up in the liker's and the snippet owner's feeds."""
+    ids = changed_ids(sender, instance, action, model, pk_set)
+    if ids is None:
+        return
+    if reverse:
+        pairs = [(snippet_id, instance.pk) for snippet_id in ids]
+    else:
+        pairs = [(instance.pk, user_id) for user_id in ids]
+    Change.objects.record(Change.LIKE, pairs, deleted=action != 'post_add')
+    snippet_ids = sorted({snippet_id for snippet_id, _ in pairs})
+    step = 1 if action == 'post_add' else -1
+    if not reverse:
+        add_likes(snippet_ids, step * len(ids))
+        invalidate_activity_feeds(instance.owner_id, *ids)
+    else:
+        # One like each, on several snippets
+        add_likes(snippet_ids, step)
+        owners = Snippet.objects.filter(pk__in=snippet_ids).values_list('owner_id', flat=True)
+        invalidate_activity_feeds(instance.pk, *owners)
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # The user's likes are deleted by cascade, which sends no m2m_changed
+    instance._liked_snippets = list(
+        Snippet.likes.through.objects.filter(user=instance).values_list('snippet_id', flat=True)
+    )
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    snippet_ids = instance.__dict__.pop('_liked_snippets', [])
+    if snippet_ids:
+        add_likes(snippet_ids, -1)
+
+@receiver(m2m_changed, sender=Collection.snippets.through)
+def collection_snippets_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Keep snippet_count in step; collections show up in their owners' feeds."""
+    ids = changed_ids(sender, instance, action, model, pk_set)
+    if ids is None:
+        return
+    if reverse:
+        pairs = [(collection_id, instance.pk) for collection_id in ids]
+    else:
+        pairs = [(instance.pk, snippet_id) for snippet_id in ids]
+    Change.objects.record(Change.MEMBERSHIP, pairs, deleted=action != 'post_add')
+    collection_ids = sorted({collection_id for collection_id, _ in pairs})
+    enqueue('refresh_snippet_count', {'collection_ids': collection_ids})
+    if not reverse:
+        invalidate_activity_feeds(instance.owner_id)
+    else:
+        owners = Collection.objects.filter(pk__in=collection_ids).values_list('owner_id', flat=True)
+        invalidate_activity_feeds(*owners)
+
+@receiver(pre_delete, sender=Snippet)
+def snippet_deleting(sender, instance, **kwargs):
+    # Memberships go with the snippet by cascade, which sends no m2m_changed
+    instance._collections = list(
+        Collection.snippets.through.objects.filter(snippet=instance).values_list('collection_id', flat=True)
+    )
+
+@receiver(post_delete, sender=Snippet)
+def snippet_deleted(sender, instance, **kwargs):
+    collection_ids = instance.__dict__.pop('_collections', [])
+    if collection_ids:
+        enqueue('refresh_snippet_count', {'collection_ids': collection_ids})
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Snippet)
+@receiver(post_save, sender=Collection)
+def suggestion_source_saved(sender, instance, update_fields=None, **kwargs):
+    # Saves of other fields (last_login, ...) leave the suggestion as it is
+    if update_fields is not None and not SUGGESTION_FIELDS.intersection(update_fields):
+        return
+    enqueue('sync_suggestions', {'kind': kind_of(sender), 'ids': [instance.pk]})
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Snippet)
+@receiver(post_delete, sender=Collection)
+def suggestion_source_deleted(sender, instance, **kwargs):
+    # Right away rather than as a task: the row may also go by cascade, after
+    # which a task could no longer tell which cached prefixes to drop
+    kind = kind_of(sender)
+    SearchSuggestion.objects.filter(kind=kind, object_id=instance.pk).delete()
+    invalidate_suggestions(normalize(getattr(instance, SOURCES[kind][1])))
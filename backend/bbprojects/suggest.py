@@ -0,0 +1,124 @@
+# Typeahead over usernames, collection names and snippet titles. Each object
+# has one SearchSuggestion row keyed by its normalized text, so a prefix is
+# a range scan of the key index. Free of model and DRF imports so models
+# and signals can use it.
+import hashlib
+import unicodedata
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Collate
+
+SUGGEST_DEFAULTS = {
+    'DEFAULT_LIMIT': 8,
+    'MAX_LIMIT': 20,
+    'CACHE_TIMEOUT': 300,
+    # Cached results are dropped per bucket, the first BUCKET_LENGTH
+    # characters of a key; longer buckets invalidate less on each write
+    'BUCKET_LENGTH': 1,
+}
+
+# Longest stored key; matches SearchSuggestion.key
+KEY_LENGTH = 200
+
+# kind -> (model label, field shown and matched, field holding the owner's id)
+SOURCES = {
+    'user': ('bbprojects.User', 'username', 'pk'),
+    'collection': ('bbprojects.Collection', 'name', 'owner_id'),
+    'snippet': ('bbprojects.Snippet', 'title', 'owner_id'),
+}
+
+def suggest_settings():
+    return {**SUGGEST_DEFAULTS, **getattr(settings, 'SEARCH_SUGGEST', {})}
+
+def normalize(text):
+    """Lower-case, accent-free, single-spaced form of ``text`` that prefixes are matched against."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())[:KEY_LENGTH]
+
+def kind_of(model):
+    label = model._meta.label
+    return next(kind for kind, (source, *_) in SOURCES.items() if source == label)
+
+def suggestion_fields(kind, pk, label, is_public, owner_id):
+    """Field values of the SearchSuggestion row for one object."""
+    return {
+        'kind': kind, 'object_id': pk, 'label': label, 'key': normalize(label),
+        'is_public': is_public, 'owner_id': owner_id,
+    }
+
+def source_rows(kind, model, batch_size, using='default'):
+    """Yield lists of ``suggestion_fields`` for every object of ``kind``, in pk order."""
+    _, label_field, owner_field = SOURCES[kind]
+    rows = model.objects.using(using).order_by('pk').values_list('pk', label_field, 'is_public', owner_field)
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        yield [suggestion_fields(kind, *row) for row in batch]
+        last_pk = batch[-1][0]
+
+def key_expression(using):
+    """The key as the prefix index orders it: byte by byte, whatever the database collation."""
+    if connections[using].vendor == 'postgresql':
+        # Matches the index on "key" COLLATE "C" created by migration 0009
+        return Collate('key', 'C')
+    return F('key')
+
+def matching_prefix(queryset, prefix):
+    """Rows of ``queryset`` whose key starts with ``prefix``, in index order."""
+    return queryset.alias(sort_key=key_expression(queryset.db)).filter(
+        sort_key__gte=prefix, sort_key__lt=prefix + '\U0010ffff'
+    ).order_by('sort_key', 'kind', 'object_id')
+
+def _version_key(bucket):
+    return f'suggest-version:{bucket}'
+
+def _result_key(version, prefix, kinds, limit):
+    digest = hashlib.blake2b(prefix.encode(), digest_size=16).hexdigest()
+    return f"suggest:{version}:{','.join(kinds)}:{limit}:{digest}"
+
+def get_suggestions(user, prefix, kinds, limit):
+    """
+    Up to ``limit`` ``{type, id, label}`` dicts whose key starts with the
+    normalized ``prefix``, in key order. Public matches are cached per prefix;
+    a signed-in user's own private objects are looked up on every call.
+    """
+    # models imports normalize from here
+    from .models import SearchSuggestion
+
+    conf = suggest_settings()
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+
+    generation_key, bucket_key = 'suggest-generation', _version_key(prefix[:conf['BUCKET_LENGTH']])
+    versions = cache.get_many([generation_key, bucket_key])
+    key = _result_key(f'{versions.get(generation_key, 0)}.{versions.get(bucket_key, 0)}', prefix, kinds, limit)
+    public = cache.get(key)
+    matching = matching_prefix(SearchSuggestion.objects.filter(kind__in=kinds), prefix)
+    if public is None:
+        public = list(matching.filter(is_public=True).values_list('key', 'kind', 'object_id', 'label')[:limit])
+        cache.set(key, public, conf['CACHE_TIMEOUT'])
+
+    rows = public
+    if user.is_authenticated:
+        own = matching.filter(owner_id=user.pk, is_public=False)
+        # Python orders str by code point, as the index does
+        rows = sorted([*public, *own.values_list('key', 'kind', 'object_id', 'label')[:limit]])[:limit]
+    return [{'type': kind, 'id': object_id, 'label': label} for _, kind, object_id, label in rows]
+
+def invalidate_suggestions(*keys):
+    """Drop cached results for every prefix bucket the given keys fall in."""
+    length = suggest_settings()['BUCKET_LENGTH']
+    buckets = {key[:size] for key in keys if key for size in range(1, length + 1)}
+    if buckets:
+        cache.set_many({_version_key(bucket): uuid.uuid4().hex for bucket in buckets}, None)
+
+def invalidate_all_suggestions():
+    cache.set('suggest-generation', uuid.uuid4().hex, None)
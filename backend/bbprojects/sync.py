@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from .exceptions import SyncTokenExpiredError
+from .models import Change, Collection, Snippet
+from .serializers import COLLECTION_SUMMARY_ROWS, SNIPPET_ROWS
+
+SYNC_DEFAULTS = {
+    'RETENTION_DAYS': 30,
+    'DEFAULT_LIMIT': 500,
+    'MAX_LIMIT': 2000,
+    # Entries this recent are held back: a transaction that took its seq
+    # earlier may not have committed yet, and skipping past it would lose it.
+    # Best-effort: one still open after this long can be skipped all the same
+    'SETTLE_SECONDS': 2,
+}
+
+def sync_settings():
+    return {**SYNC_DEFAULTS, **getattr(settings, 'SYNC_CHANGES', {})}
+
+def parse_sync_params(query_params):
+    """Validate ``since`` (a previous ``next`` token; absent to start) and ``limit``."""
+    conf = sync_settings()
+
+    since = query_params.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            raise serializers.ValidationError({'since': 'A valid integer is required.'})
+        if since < 0:
+            raise serializers.ValidationError({'since': 'Must not be negative.'})
+
+    try:
+        limit = int(query_params.get('limit', conf['DEFAULT_LIMIT']))
+    except ValueError:
+        raise serializers.ValidationError({'limit': 'A valid integer is required.'})
+    if not 1 <= limit <= conf['MAX_LIMIT']:
+        raise serializers.ValidationError({'limit': f"Must be between 1 and {conf['MAX_LIMIT']}."})
+
+    return since, limit
+
+def _settled():
+    return Change.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=sync_settings()['SETTLE_SECONDS']))
+
+def current_token():
+    """The token to start from after fetching the full lists."""
+    return _settled().order_by('-seq').values_list('seq', flat=True).first() or 0
+
+def _visible(user):
+    if user.is_authenticated:
+        return Q(is_public=True) | Q(owner=user)
+    return Q(is_public=True)
+
+def get_changes(request, since, limit):
+    """
+    Changes after ``since``, oldest first, at most one per object (or
+    membership/like pair): snippets and collections as they are now, or as
+    deletions once gone or no longer visible to the caller.
+    """
+    user = request.user
+    oldest = Change.objects.order_by('seq').values_list('seq', flat=True).first()
+    if oldest is not None and since < oldest - 1:
+        raise SyncTokenExpiredError()
+
+    rows, has_more = Change.objects.settled_after(since, limit, sync_settings()['SETTLE_SECONDS'])
+
+    latest = {}
+    for seq, kind, object_id, related_id, deleted in rows:
+        key = (kind, object_id, related_id)
+        latest.pop(key, None)
+        latest[key] = (seq, deleted)
+
+    wanted = {Change.SNIPPET: set(), Change.COLLECTION: set()}
+    for (kind, object_id, _), (_, deleted) in latest.items():
+        if not deleted and kind in wanted:
+            wanted[kind].add(object_id)
+        elif kind == Change.MEMBERSHIP:
+            wanted[Change.COLLECTION].add(object_id)
+
+    snippets = SNIPPET_ROWS.map(
+        Snippet.objects.filter(_visible(user), pk__in=wanted[Change.SNIPPET])
+        .with_like_info(user).values(*SNIPPET_ROWS.columns)
+    )
+    snippets = {row['id']: row for row in snippets}
+    collections = COLLECTION_SUMMARY_ROWS.map(
+        Collection.objects.filter(_visible(user), pk__in=wanted[Change.COLLECTION])
+        .values(*COLLECTION_SUMMARY_ROWS.columns)
+    )
+    collections = {row['id']: row for row in collections}
+    objects = {Change.SNIPPET: snippets, Change.COLLECTION: collections}
+
+    changes = []
+    for (kind, object_id, related_id), (seq, deleted) in latest.items():
+        if kind in objects:
+            data = None if deleted else objects[kind].get(object_id)
+            change = {'seq': seq, 'type': kind, 'op': 'delete' if data is None else 'upsert', 'id': object_id}
+            if data is not None:
+                change['data'] = data
+        elif kind == Change.MEMBERSHIP:
+            # Memberships of collections the caller can't see are left out;
+            # the collection itself comes through as a deletion
+            if object_id not in collections:
+                continue
+            change = {'seq': seq, 'type': kind, 'op': 'delete' if deleted else 'add',
+                      'collection': object_id, 'snippet': related_id}
+        else:
+            # Only the caller's own likes; everyone else sees likes_count change
+            if related_id != user.pk:
+                continue
+            change = {'seq': seq, 'type': kind, 'op': 'delete' if deleted else 'add', 'snippet': object_id}
+        changes.append(change)
+
+    return {
+        'changes': changes,
+        'next': rows[-1][0] if rows else since,
+        'has_more': has_more,
+    }
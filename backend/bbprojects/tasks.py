@@ -0,0 +1,204 @@
+"""
+A small task queue kept in the Task table, run by ``manage.py run_worker``.
+
+``enqueue()`` inserts the task in the caller's transaction, so it only becomes
+visible to workers if that transaction commits. With BACKGROUND_TASKS['EAGER']
+there is no worker: the task runs in-process right after the commit instead,
+and tasks queued with ``eager=False`` are run by a thread of this process.
+Tasks registered with ``batch=True`` get every claimed payload of their name
+in one call.
+"""
+import logging
+import random
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Snippet, Collection, SearchSuggestion, Task, Change
+from .suggest import invalidate_suggestions
+
+logger = logging.getLogger(__name__)
+
+TASK_DEFAULTS = {
+    'EAGER': True,
+    'MAX_ATTEMPTS': 5,
+    # Retry n waits BACKOFF_BASE * 2 ** (n - 1) seconds (with jitter), at most BACKOFF_MAX
+    'BACKOFF_BASE': 2,
+    'BACKOFF_MAX': 600,
+    # How long a worker may hold tasks before others assume it died
+    'LEASE_SECONDS': 300,
+    'BATCH_SIZE': 100,
+}
+
+# name -> (function, batch)
+REGISTRY = {}
+
+# The thread draining the queue in eager mode, and whether it should look again
+_drainer = {'thread': None, 'again': False}
+_drainer_lock = threading.Lock()
+
+def task_settings():
+    return {**TASK_DEFAULTS, **getattr(settings, 'BACKGROUND_TASKS', {})}
+
+def task(name, batch=False):
+    """Register a task; batch tasks take a list of payloads, others one payload."""
+    def register(func):
+        REGISTRY[name] = (func, batch)
+        return func
+    return register
+
+def enqueue(name, payload=None, eager=None):
+    """Queue task ``name``; ``eager=False`` stores it for a worker even when BACKGROUND_TASKS['EAGER'] is on."""
+    if name not in REGISTRY:
+        raise KeyError(f'Unknown task: {name}')
+    payload = payload or {}
+    if eager is None:
+        eager = task_settings()['EAGER']
+    if eager:
+        transaction.on_commit(lambda: run_eagerly(name, payload))
+    else:
+        Task.objects.create(name=name, payload=payload)
+        if task_settings()['EAGER']:
+            # No worker will pick it up; run it after the commit, off the request
+            transaction.on_commit(drain_in_background)
+
+def drain_in_background():
+    """Run the queued tasks on a thread of this process, starting one unless it is already running."""
+    with _drainer_lock:
+        _drainer['again'] = True
+        if _drainer['thread'] is None:
+            _drainer['thread'] = threading.Thread(target=_drain, name='task-drainer', daemon=True)
+            _drainer['thread'].start()
+        return _drainer['thread']
+
+def _drain():
+    try:
+        while True:
+            with _drainer_lock:
+                if not _drainer['again']:
+                    _drainer['thread'] = None
+                    return
+                _drainer['again'] = False
+            try:
+                run_pending()
+            except Exception:
+                logger.exception('Draining queued tasks failed')
+    finally:
+        connections.close_all()
+
+def run_eagerly(name, payload):
+    func, batch = REGISTRY[name]
+    try:
+        func([payload] if batch else payload)
+    except Exception:
+        # The request's own work is already committed; don't turn it into an error
+        logger.exception('Task %s failed', name, extra={'task': name})
+
+def backoff(attempts):
+    conf = task_settings()
+    delay = min(conf['BACKOFF_MAX'], conf['BACKOFF_BASE'] * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+def claim(batch_size=None):
+    """
+    Lease the due tasks of one name, oldest first, and return them as
+    ``(name, [(pk, payload, attempts), ...])``, or None when nothing is due.
+    """
+    conf = task_settings()
+    now = timezone.now()
+    due = Task.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        status=Task.QUEUED, run_after__lte=now,
+    ).order_by('run_after', 'pk')
+    with transaction.atomic():
+        # SKIP LOCKED lets workers claim side by side on Postgres; SQLite
+        # serializes the write transactions instead
+        name = due.select_for_update(skip_locked=True).values_list('name', flat=True).first()
+        if name is None:
+            return None
+        rows = list(
+            due.filter(name=name).select_for_update(skip_locked=True)
+            .values_list('pk', 'payload', 'attempts')[:batch_size or conf['BATCH_SIZE']]
+        )
+        Task.objects.filter(pk__in=[pk for pk, *_ in rows]).update(
+            locked_until=now + timedelta(seconds=conf['LEASE_SECONDS']), attempts=F('attempts') + 1,
+        )
+    return name, [(pk, payload, attempts + 1) for pk, payload, attempts in rows]
+
+def run_claimed(name, rows):
+    """Run claimed tasks; delete the ones that succeed and reschedule or fail the rest."""
+    if name not in REGISTRY:
+        _failed(rows, f'Unknown task: {name}', final=True)
+        return
+    func, batch = REGISTRY[name]
+    groups = [rows] if batch else [[row] for row in rows]
+    for group in groups:
+        try:
+            func([payload for _, payload, _ in group] if batch else group[0][1])
+        except Exception:
+            logger.exception('Task %s failed', name, extra={'task': name, 'tasks': len(group)})
+            _failed(group, traceback.format_exc())
+        else:
+            Task.objects.filter(pk__in=[pk for pk, *_ in group]).delete()
+
+def _failed(rows, error, final=False):
+    max_attempts = task_settings()['MAX_ATTEMPTS']
+    now = timezone.now()
+    for pk, _, attempts in rows:
+        if final or attempts >= max_attempts:
+            changes = {'status': Task.FAILED}
+        else:
+            changes = {'run_after': now + backoff(attempts)}
+        Task.objects.filter(pk=pk).update(locked_until=None, last_error=error, **changes)
+
+def run_pending(batch_size=None):
+    """Run due tasks until none are left; returns how many were claimed."""
+    claimed = 0
+    while (batch := claim(batch_size)) is not None:
+        run_claimed(*batch)
+        claimed += len(batch[1])
+    return claimed
+
+# Tasks. All of them recompute from the current rows, so running one late,
+# twice or out of order gives the same result.
+
+@task('refresh_likes_count', batch=True)
+def refresh_likes_count(payloads):
+    # feeds imports DRF; tasks is loaded with the app
+    from .feeds import invalidate_activity_feeds
+
+    snippet_ids = {pk for payload in payloads for pk in payload['snippet_ids']}
+    with transaction.atomic():
+        Snippet.objects.filter(pk__in=snippet_ids).refresh_likes_count()
+        # Sync clients pick up the new counts
+        Change.objects.record(Change.SNIPPET, sorted(snippet_ids))
+    invalidate_activity_feeds(snippet_ids=snippet_ids)
+
+@task('refresh_snippet_count', batch=True)
+def refresh_snippet_count(payloads):
+    collection_ids = {pk for payload in payloads for pk in payload['collection_ids']}
+    with transaction.atomic():
+        Collection.objects.filter(pk__in=collection_ids).refresh_snippet_count()
+        Change.objects.record(Change.COLLECTION, sorted(collection_ids))
+
+@task('sync_suggestions', batch=True)
+def sync_suggestions(payloads):
+    ids = {}
+    for payload in payloads:
+        ids.setdefault(payload['kind'], set()).update(payload['ids'])
+    for kind, object_ids in ids.items():
+        invalidate_suggestions(*SearchSuggestion.objects.sync(kind, object_ids))
+
+@task('purge_deleted')
+def purge_deleted(payload):
+    # deletion imports the refresh tasks from here
+    from .deletion import deletion_settings, purge
+
+    if not purge(payload['model'], payload['id'], time_budget=deletion_settings()['TIME_BUDGET']):
+        # Out of time; carry on in a fresh task
+        enqueue('purge_deleted', payload, eager=False)
@@ -1,3 +1,1064 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import random
+import sys
+import tempfile
+import threading
+import tracemalloc
+import zlib
+from datetime import timedelta
+from contextlib import ExitStack
+from io import StringIO
+from pathlib import Path
+from types import ModuleType
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+from rest_framework.routers import DefaultRouter
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import asyncviews
+from .benchmarks import USERNAME_PREFIX, seed
+from .compression import Brotli, CompressionMiddleware, Gzip, brotli, parse_accept_encoding
+from .db_routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+from .instrumentation import QueryTracker
+from .log import JSONFormatter, RequestLogMiddleware
+from .live import ChangeLogBackend, Hub, LiveUpdatesApp, Subscription, get_hub
+from .deletion import purge, soft_delete
+from .models import User, Snippet, Collection, CodeBlob, Task, Change
+from .serializers import (
+    COLLECTION_SUMMARY_ROWS, SNIPPET_ROWS, USER_ROWS, CollectionSummarySerializer, SnippetSerializer, UserSerializer,
+)
+from .tasks import REGISTRY, _drainer, drain_in_background, enqueue, run_pending
+from .urls import router
+
+QUERY_BUDGETS = Path(__file__).resolve().parent / 'query_budgets.json'
+
+# Two dataset sizes; every endpoint must run the same number of queries on both
+SMALL = dict(users=3, snippets_per_user=2, likes_per_snippet=2, collections_per_user=1,
+             snippets_per_collection=2, large_collection_size=3, code_size=20)
+LARGE = dict(users=8, snippets_per_user=6, likes_per_snippet=5, collections_per_user=2,
+             snippets_per_collection=5, large_collection_size=25, code_size=20)
+
+def router_endpoints():
+    """``(key, url name, method, detail)`` for every route and method registered on the router."""
+    endpoints = []
+    seen = set()
+    for pattern in router.urls:
+        if pattern.name in seen or 'format' in str(pattern.pattern):
+            continue
+        seen.add(pattern.name)
+        actions = getattr(pattern.callback, 'actions', None) or {'get': None}
+        detail = 'pk' in pattern.pattern.regex.groupindex
+        for method in actions:
+            # DRF adds HEAD to a GET route's actions once it has served a request
+            if method != 'head':
+                endpoints.append((f'{pattern.name} {method.upper()}', pattern.name, method, detail))
+    return endpoints
+
+class QueryCountRegressionTests(TestCase):
+    """
+    Every router endpoint must run O(1) queries in the size of the page it
+    returns, and stay within its budget in query_budgets.json.
+    """
+
+    def test_router_endpoints_run_constant_queries(self):
+        budgets = json.loads(QUERY_BUDGETS.read_text())
+        endpoints = router_endpoints()
+
+        missing = [key for key, *_ in endpoints if key not in budgets]
+        self.assertFalse(missing, f'Add query budgets for: {", ".join(missing)}')
+
+        small = self.measure(SMALL, endpoints)
+        large = self.measure(LARGE, endpoints)
+
+        for key, *_ in endpoints:
+            with self.subTest(endpoint=key):
+                (small_count, _, small_status), (large_count, tracker, large_status) = small[key], large[key]
+                self.assertLess(large_status, 500, key)
+                self.assertEqual(
+                    small_count, large_count,
+                    f'{key} ran {small_count} queries on the small dataset and '
+                    f'{large_count} on the large one.\n{self.describe(tracker)}'
+                )
+                self.assertLessEqual(
+                    large_count, budgets[key],
+                    f'{key} ran {large_count} queries, over its budget of {budgets[key]}.\n'
+                    f'{self.describe(tracker)}'
+                )
+
+    def measure(self, sizes, endpoints):
+        """Seed ``sizes`` inside a rolled back savepoint and count each endpoint's queries."""
+        results = {}
+        with transaction.atomic():
+            seed(**sizes)
+            user = User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id').first()
+            collection = Collection.objects.get(owner=user, name='Large collection')
+            member = collection.snippets.order_by('id').first()
+            outsider = user.snippets.exclude(collections=collection).order_by('id').first()
+            # The like endpoint toggles; always measure the "add a like" path
+            member.likes.remove(user)
+            pks = {'user': user.pk, 'snippet': member.pk, 'collection': collection.pk}
+            snippet = {'title': 'Measured', 'code_content': 'print(1)', 'language': 'python'}
+            data = {
+                'collection-add-snippet POST': {'snippet_id': outsider.pk},
+                'collection-remove-snippet POST': {'snippet_id': member.pk},
+                'snippet-list POST': snippet,
+                'snippet-detail PUT': snippet,
+                'snippet-detail PATCH': {'title': 'Renamed'},
+                'collection-list POST': {'name': 'Measured'},
+                'collection-detail PUT': {'name': 'Measured'},
+                'collection-detail PATCH': {'name': 'Renamed'},
+                'user-detail PUT': {'bio': 'Measured'},
+                'user-detail PATCH': {'bio': 'Renamed'},
+                'user-me PATCH': {'location': 'Measured'},
+            }
+
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+            def url(name, detail):
+                basename = name.split('-')[0]
+                return reverse(name, kwargs={'pk': pks[basename]} if detail else {})
+
+            # Warm process-wide caches (content types, permissions) once
+            for _, name, method, detail in endpoints:
+                if method == 'get':
+                    client.get(url(name, detail))
+
+            # Reads, then writes, then deletes, deleting the user itself last
+            order = {'get': 0, 'delete': 2}
+            for key, name, method, detail in sorted(
+                    endpoints, key=lambda e: (order.get(e[2], 1), e[1] == 'user-detail')):
+                cache.clear()
+                with ExitStack() as stack:
+                    tracker = QueryTracker().track(stack)
+                    response = getattr(client, method)(url(name, detail), data.get(key, {}), format='json')
+                results[key] = (tracker.count, tracker, response.status_code)
+
+            transaction.set_rollback(True)
+        return results
+
+    def describe(self, tracker):
+        repeated = tracker.repeated()
+        if not repeated:
+            return 'No statement ran more than once.'
+        return 'Repeated statements:\n' + '\n'.join(f'  {n}x {sql}' for n, sql in repeated)
+
+class RowMapperParityTests(TestCase):
+    """The .values() fast path returns exactly what the serializers would."""
+
+    def setUp(self):
+        seed(**SMALL)
+        self.user = User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id').first()
+        self.user.liked_snippets.add(*Snippet.objects.exclude(owner=self.user)[:2])
+        # Compressed code, an empty description and a private snippet
+        Snippet.objects.create(title='long', code_content='print(1)\n' * 200, language='python',
+                               owner=self.user, is_public=False)
+        Collection.objects.create(name='empty', owner=self.user)
+
+    def test_rows_match_the_serializers(self):
+        request = RequestFactory().get('/')
+        cases = [
+            (SNIPPET_ROWS, SnippetSerializer, lambda user: Snippet.objects.with_like_info(user)),
+            (USER_ROWS, UserSerializer, lambda user: User.objects.all()),
+            (COLLECTION_SUMMARY_ROWS, CollectionSummarySerializer, lambda user: Collection.objects.all()),
+        ]
+        for user in (AnonymousUser(), self.user):
+            request.user = user
+            for mapper, serializer_class, queryset in cases:
+                with self.subTest(serializer=serializer_class.__name__, user=str(user)):
+                    rows = queryset(user).order_by('pk')
+                    expected = serializer_class(rows, many=True, context={'request': request}).data
+                    self.assertEqual(mapper.map(rows.values(*mapper.columns)), expected)
+
+    def test_list_endpoints_match_with_the_fast_path_off(self):
+        client = APIClient()
+        for user in (None, self.user):
+            client.force_authenticate(user)
+            for url in ('/api/snippets/', '/api/users/', '/api/snippets/?ordering=-likes_count'):
+                with self.subTest(url=url, authenticated=user is not None):
+                    with override_settings(FAST_LIST_SERIALIZATION=True):
+                        fast = client.get(url).json()
+                    with override_settings(FAST_LIST_SERIALIZATION=False):
+                        self.assertEqual(client.get(url).json(), fast)
+
+class PerformanceMiddlewareTests(TestCase):
+    """Server-Timing is for staff (or DEBUG) only and includes serialization time."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='viewer', email='viewer@example.com')
+
+    @override_settings(DEBUG=False)
+    def test_server_timing_is_only_sent_to_staff(self):
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('Server-Timing', self.client.get('/api/snippets/'))
+
+        self.user.is_staff = True
+        self.user.save()
+        timing = self.client.get('/api/snippets/')['Server-Timing']
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('db;dur=', timing)
+
+    @override_settings(DEBUG=True)
+    def test_async_requests_count_their_queries(self):
+        # AsyncClient runs the middleware chain through the ASGI handler
+        response = async_to_sync(AsyncClient().get)('/api/snippets/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+@override_settings(RESPONSE_COMPRESSION={'MIN_SIZE': 1024})
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Responses get the best coding the client accepts, once they are big enough and not already encoded."""
+
+    body = json.dumps([{'id': n, 'title': f'snippet {n}'} for n in range(100)]).encode()
+
+    def respond(self, response, accept='gzip'):
+        middleware = CompressionMiddleware(lambda request: response)
+        request = RequestFactory().get('/api/snippets/', HTTP_ACCEPT_ENCODING=accept)
+        return middleware(request)
+
+    def json_response(self, body=None, **headers):
+        return HttpResponse(self.body if body is None else body, content_type='application/json', headers=headers)
+
+    def test_accept_encoding_is_parsed_with_q_values(self):
+        self.assertEqual(
+            parse_accept_encoding('gzip;q=0.5, BR , zstd;q=0,, identity;q=1.2.3'),
+            {'gzip': 0.5, 'br': 1.0, 'zstd': 0.0, 'identity': 0.0},
+        )
+
+    @skipUnless(brotli, 'needs brotli')
+    def test_highest_q_value_wins_and_zero_refuses(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        middleware.encoders = [Brotli(4), Gzip(5)]
+        for header, expected in (
+            ('gzip;q=0.5, br;q=0.9', 'br'), ('gzip, br;q=0.1', 'gzip'), ('br;q=0, *', 'gzip'),
+            ('gzip;q=0', None), ('*;q=0', None), ('', None),
+        ):
+            with self.subTest(header=header):
+                encoder = middleware.negotiate(header)
+                self.assertEqual(encoder and encoder.name, expected)
+
+    def test_bodies_under_min_size_are_sent_as_is(self):
+        response = self.respond(self.json_response(b'x' * 1023))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        response = self.respond(self.json_response(b'x' * 1024))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(response.content, 31), b'x' * 1024)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_compressed_responses_vary_and_weaken_their_etag(self):
+        response = self.respond(self.json_response(ETag='"abc"'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(zlib.decompress(response.content, 31), self.body)
+
+        response = self.respond(self.json_response(ETag='"abc"'), accept='identity')
+        self.assertEqual(response['ETag'], '"abc"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_encoded_and_event_stream_responses_are_left_alone(self):
+        response = self.respond(self.json_response(**{'Content-Encoding': 'br'}))
+        self.assertEqual((response['Content-Encoding'], response.content), ('br', self.body))
+
+        events = StreamingHttpResponse(iter([b'data: 1\n\n'] * 200), content_type='text/event-stream')
+        response = self.respond(events)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'data: 1\n\n' * 200)
+
+    def test_streaming_responses_are_compressed_by_chunk(self):
+        chunks = [self.body[i:i + 100] for i in range(0, len(self.body), 100)]
+        stream = StreamingHttpResponse(iter(chunks), content_type='application/json',
+                                       headers={'Content-Length': str(len(self.body))})
+        response = self.respond(stream)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(zlib.decompress(b''.join(response.streaming_content), 31), self.body)
+
+class RequestLogTests(SimpleTestCase):
+    """Log records are single JSON lines, and only a sample of requests is logged."""
+
+    def test_records_format_as_json_with_extra_fields(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord('bbprojects.tasks', logging.ERROR, __file__, 1, 'Task %s failed',
+                                       ('purge',), sys.exc_info())
+        record.task = 'purge'
+        record.when = timezone.now()
+        line = JSONFormatter().format(record)
+        self.assertNotIn('\n', line)
+        payload = json.loads(line)
+        self.assertEqual(
+            {key: payload[key] for key in ('level', 'logger', 'message', 'task')},
+            {'level': 'ERROR', 'logger': 'bbprojects.tasks', 'message': 'Task purge failed', 'task': 'purge'},
+        )
+        self.assertEqual(payload['when'], str(record.when))
+        self.assertIn('ValueError: boom', payload['exc_info'])
+        self.assertNotIn('args', payload)
+
+    def middleware(self, rate):
+        with override_settings(REQUEST_LOG={'SAMPLE_RATE': rate}):
+            return RequestLogMiddleware(lambda request: HttpResponse(status=204))
+
+    def test_requests_are_sampled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            self.middleware(0)
+
+        request = RequestFactory().get('/api/snippets/')
+        with self.assertLogs('bbprojects.requests', 'INFO') as logs:
+            self.middleware(1)(request)
+        self.assertEqual(len(logs.records), 1)
+        record = logs.records[0]
+        self.assertEqual((record.method, record.status, record.queries), ('GET', 204, 0))
+
+        random.seed(0)
+        middleware = self.middleware(0.25)
+        with self.assertLogs('bbprojects.requests', 'INFO') as logs:
+            for _ in range(400):
+                middleware(request)
+        self.assertTrue(60 < len(logs.records) < 140, len(logs.records))
+
+    def test_nothing_is_sampled_when_info_is_off(self):
+        logger = logging.getLogger('bbprojects.requests')
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            self.assertFalse(self.middleware(1).sampled())
+        finally:
+            logger.setLevel(level)
+
+class AsyncMiddlewareTests(SimpleTestCase):
+
+    @override_settings(DEBUG=True, REQUEST_LOG={'SAMPLE_RATE': 1})
+    def test_asgi_chain_runs_without_adapting_middleware(self):
+        # Under DEBUG Django logs every sync middleware it has to adapt; one
+        # is enough to hold a thread for the whole of each request
+        with self.assertLogs('django.request', 'DEBUG') as logs:
+            ASGIHandler()
+            logging.getLogger('django.request').debug('loaded')
+        self.assertEqual([line for line in logs.output if 'adapted' in line], [])
+
+def async_urlconf():
+    """The API routes as the ASGI mode (ASYNC_READ_VIEWS) registers them."""
+    async_router = DefaultRouter()
+    async_router.register(r'users', asyncviews.UserViewSet, basename='user')
+    async_router.register(r'snippets', asyncviews.SnippetViewSet)
+    async_router.register(r'collections', asyncviews.CollectionViewSet)
+    urlconf = ModuleType('async_urls')
+    urlconf.urlpatterns = [path('api/', include(async_router.urls))]
+    return urlconf
+
+class AsyncReadViewTests(TransactionTestCase):
+    """
+    The async viewsets answer exactly as the sync ones. Outside a test
+    transaction stats and activity run their queries side by side.
+    """
+
+    def setUp(self):
+        seed(**SMALL)
+        self.user = User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id').first()
+        self.user.liked_snippets.add(*Snippet.objects.exclude(owner=self.user)[:2])
+        self.auth = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.urlconf = async_urlconf()
+
+    def test_responses_match_the_sync_views(self):
+        snippet = Snippet.objects.filter(is_public=True).order_by('id').first()
+        collection = Collection.objects.filter(is_public=True).order_by('id').first()
+        anonymous = [
+            reverse('snippet-list'), reverse('snippet-list') + '?ordering=-likes_count',
+            reverse('snippet-detail', args=[snippet.pk]),
+            reverse('collection-list'), reverse('collection-detail', args=[collection.pk]),
+        ]
+        authenticated = anonymous + [
+            reverse('user-me'), reverse('user-stats'),
+            reverse('user-activity') + '?kinds=snippets,collections,likes_given,likes_received',
+            reverse('user-activity') + '?kinds=bogus',
+        ]
+        for urls, headers in ((anonymous, {}), (authenticated, {'Authorization': self.auth})):
+            for url in urls:
+                with self.subTest(url=url, authenticated=bool(headers)):
+                    cache.clear()
+                    expected = self.client.get(url, headers=headers)
+                    cache.clear()
+                    with override_settings(ROOT_URLCONF=self.urlconf):
+                        response = async_to_sync(AsyncClient().get)(url, headers=headers)
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(response.json(), expected.json())
+        self.assertTrue(any(thread.name.startswith('read') for thread in threading.enumerate()))
+
+    def test_missing_objects_and_anonymous_users_are_refused(self):
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            client = AsyncClient()
+            self.assertEqual(async_to_sync(client.get)(reverse('snippet-detail', args=[0])).status_code, 404)
+            self.assertEqual(async_to_sync(client.get)(reverse('user-stats')).status_code, 401)
+
+class CollectionSnippetCountTests(TestCase):
+    """Collections filter and sort on their stored snippet_count."""
+
+    def setUp(self):
+        owner = User.objects.create(username='owner', email='owner@example.com')
+        snippets = [Snippet.objects.create(title=f's{n}', code_content='x', language='python', owner=owner)
+                    for n in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for size in (0, 1, 3):
+                Collection.objects.create(name=f'holds {size}', owner=owner).snippets.add(*snippets[:size])
+        self.url = reverse('collection-list')
+
+    def names(self, **params):
+        response = APIClient().get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json()['results']]
+
+    def test_filters_and_ordering(self):
+        self.assertEqual(self.names(snippets_count=1), ['holds 1'])
+        self.assertEqual(self.names(snippet_count_min=1, ordering='snippet_count'), ['holds 1', 'holds 3'])
+        self.assertEqual(self.names(snippet_count_max=1, ordering='-snippet_count'), ['holds 1', 'holds 0'])
+        self.assertEqual(self.names(ordering='-snippet_count'), ['holds 3', 'holds 1', 'holds 0'])
+
+    def test_invalid_counts_are_rejected(self):
+        for params in ({'snippets_count': 'many'}, {'snippet_count_min': '1x'}, {'snippet_count_max': '1,2'}):
+            with self.subTest(params=params):
+                self.assertEqual(APIClient().get(self.url, params).status_code, 400)
+        # Blank values leave the filter off
+        self.assertEqual(len(self.names(snippet_count_max='')), 3)
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Reads of safe requests go to a replica unless the user wrote recently.
+    The replica is a second SQLite file that only gets the rows a test copies
+    into it, so every response shows which database it was read from.
+    """
+
+    # Resolved in setUpClass, once replica_1 has been added
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        connections.settings['replica_1'] = {
+            **connections.settings['default'], 'NAME': f'{cls.tmp.name}/replica.sqlite3'}
+        # Replicas are never migrated; create the schema the way replication would
+        with connections['replica_1'].schema_editor() as editor:
+            for model in apps.get_models():
+                if model._meta.managed and not model._meta.proxy:
+                    editor.create_model(model)
+        cls.shared_cache = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': f'{cls.tmp.name}/cache',
+        }})
+        cls.shared_cache.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.shared_cache.disable()
+        connections['replica_1'].close()
+        del connections['replica_1']
+        del connections.settings['replica_1']
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@example.com')
+        self.replicate(self.author)
+        self.client = APIClient()
+
+    def tearDown(self):
+        # flush only empties tables the router lets it migrate, so not the replica's
+        replica = connections['replica_1']
+        replica.ops.execute_sql_flush(replica.ops.sql_flush(no_style(), replica.introspection.table_names()))
+
+    def replicate(self, *objects):
+        for obj in objects:
+            obj.save(using='replica_1', force_insert=True)
+
+    def snippet(self, title):
+        return Snippet.objects.create(title=title, code_content=title, language='python', owner=self.author)
+
+    def titles(self, user=None):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/snippets/')
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.json()['results']]
+
+    def test_safe_requests_read_from_a_replica(self):
+        snippet = self.snippet('lagging')
+        self.assertEqual(self.titles(), [])
+        self.assertEqual(self.titles(self.author), [])
+
+        self.replicate(snippet.code_blob, snippet)
+        self.assertEqual(self.titles(), ['lagging'])
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.snippet('primary only')
+        self.assertEqual(Snippet.objects.count(), 1)
+        self.assertEqual(Snippet.objects.using('replica_1').count(), 0)
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post('/api/snippets/', {
+            'title': 'fresh', 'code_content': 'print(1)', 'language': 'python'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.titles(self.author), ['fresh'])
+        self.assertEqual(self.titles(), [])
+
+    def test_async_requests_are_routed_and_pinned(self):
+        client = AsyncClient()
+        author = {'authorization': f'Bearer {RefreshToken.for_user(self.author).access_token}'}
+        response = async_to_sync(client.post)('/api/snippets/', {
+            'title': 'fresh', 'code_content': 'print(1)', 'language': 'python'},
+            content_type='application/json', headers=author)
+        self.assertEqual(response.status_code, 201)
+
+        for headers, titles in ((author, ['fresh']), (None, [])):
+            response = async_to_sync(client.get)('/api/snippets/', headers=headers)
+            self.assertEqual([row['title'] for row in response.json()['results']], titles)
+
+    def test_replicas_need_a_shared_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+    def test_replicas_are_never_migrated(self):
+        router = PrimaryReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica_1', 'bbprojects'))
+        self.assertTrue(router.allow_migrate('default', 'bbprojects'))
+
+QUEUED = {'EAGER': False, 'MAX_ATTEMPTS': 2, 'BACKOFF_BASE': 0, 'BATCH_SIZE': 10}
+
+class AdminSearchTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'checks the SQLite query plan')
+    def test_prefix_and_exact_searches_use_an_index(self):
+        searches = [
+            (Snippet.objects.filter(title__istartswith='a'), 'snippet_title_search'),
+            (Collection.objects.filter(name__istartswith='a'), 'collection_name_search'),
+            (User.objects.filter(username__iexact='a'), 'user_username_search'),
+            (User.objects.filter(email__istartswith='a'), 'user_email_search'),
+        ]
+        for queryset, index in searches:
+            self.assertIn(f'USING INDEX {index}', queryset.explain())
+
+    def test_descriptions_are_searched_on_request(self):
+        owner = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        Snippet.objects.create(title='parser', description='Handles UTF-8 input', code_content='x',
+                               language='python', owner=owner)
+        Snippet.objects.create(title='utf helpers', code_content='x', language='python', owner=owner)
+        self.client.force_login(owner)
+        url = reverse('admin:bbprojects_snippet_changelist')
+        for query, expected in (('utf', ['utf helpers']), ('Description: utf-8', ['parser'])):
+            with self.subTest(query=query):
+                response = self.client.get(url, {'q': query})
+                self.assertEqual([s.title for s in response.context['cl'].result_list], expected)
+
+class SearchSuggestTests(TestCase):
+    """Typeahead matches normalized prefixes, hides others' private rows and drops stale results."""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='owner', email='owner@example.com')
+        self.url = reverse('search-suggest')
+
+    def snippet(self, title, is_public=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Snippet.objects.create(title=title, code_content='x', language='python',
+                                          owner=self.owner, is_public=is_public)
+
+    def labels(self, query, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        response = client.get(self.url, {'q': query, 'types': 'snippet'})
+        self.assertEqual(response.status_code, 200)
+        return [result['label'] for result in response.json()['results']]
+
+    def test_prefixes_match_without_case_or_accents(self):
+        for title in ('Crème Brûlée', 'creme fraiche', 'other'):
+            self.snippet(title)
+        self.assertEqual(self.labels('CREME'), ['Crème Brûlée', 'creme fraiche'])
+        self.assertEqual(self.labels('crème  b'), ['Crème Brûlée'])
+        self.assertEqual(APIClient().get(self.url, {'q': ' '}).status_code, 400)
+
+    def test_private_rows_only_reach_their_owner(self):
+        self.snippet('plan a')
+        self.snippet('plan b', is_public=False)
+        other = User.objects.create(username='other', email='other@example.com')
+        self.assertEqual(self.labels('plan'), ['plan a'])
+        self.assertEqual(self.labels('plan', other), ['plan a'])
+        self.assertEqual(self.labels('plan', self.owner), ['plan a', 'plan b'])
+
+    def test_renames_and_deletions_drop_cached_results(self):
+        snippet = self.snippet('alpha')
+        self.assertEqual(self.labels('al'), ['alpha'])
+        snippet.title = 'beta'
+        with self.captureOnCommitCallbacks(execute=True):
+            snippet.save()
+        self.assertEqual(self.labels('al'), [])
+        self.assertEqual(self.labels('be'), ['beta'])
+        with self.captureOnCommitCallbacks(execute=True):
+            snippet.delete()
+        self.assertEqual(self.labels('be'), [])
+
+    def test_admin_visibility_actions_update_suggestions(self):
+        secret = self.snippet('secret plan')
+        self.assertEqual(self.labels('secret'), ['secret plan'])
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        # From the changelist filtered to public snippets, which the action empties
+        url = reverse('admin:bbprojects_snippet_changelist') + '?is_public__exact=1'
+        response = self.client.post(url, {'action': 'make_private', '_selected_action': [secret.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Snippet.objects.get(pk=secret.pk).is_public)
+        self.assertEqual(self.labels('secret'), [])
+        self.assertEqual(self.labels('secret', self.owner), ['secret plan'])
+
+class ActivityFeedTests(TestCase):
+    """The feed validates its parameters, hides others' private snippets and never serves stale copies."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@example.com')
+        self.reader = User.objects.create(username='reader', email='reader@example.com')
+        self.snippet = Snippet.objects.create(title='first', code_content='x', language='python',
+                                              owner=self.author)
+        self.snippet.likes.add(self.reader)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.url = reverse('user-activity')
+
+    def liked(self):
+        response = self.client.get(self.url, {'kinds': 'likes_given'})
+        self.assertEqual(response.status_code, 200)
+        return [(s['title'], s['owner']['username'], s['likes_count']) for s in response.json()['likes_given']]
+
+    def test_kinds_and_limit_are_validated(self):
+        response = self.client.get(self.url, {'kinds': 'likes_given,,likes_given', 'limit': '1'})
+        self.assertEqual(list(response.json()), ['likes_given'])
+        for params in ({'kinds': 'snippets,bogus'}, {'limit': '0'}, {'limit': '51'}, {'limit': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_private_snippets_of_others_are_hidden(self):
+        own = Snippet.objects.create(title='mine', code_content='x', language='python',
+                                     owner=self.reader, is_public=False)
+        own.likes.add(self.reader)
+        Snippet.objects.filter(pk=self.snippet.pk).update(is_public=False)
+        self.assertEqual(self.liked(), [('mine', 'reader', 1)])
+
+    def test_changes_to_shown_snippets_refresh_the_feed(self):
+        self.assertEqual(self.liked(), [('first', 'author', 1)])
+        self.snippet.refresh_from_db()
+        self.snippet.title = 'renamed'
+        self.snippet.save()
+        self.assertEqual(self.liked(), [('renamed', 'author', 1)])
+        self.snippet.likes.add(User.objects.create(username='third', email='third@example.com'))
+        self.assertEqual(self.liked(), [('renamed', 'author', 2)])
+        self.author.username = 'writer'
+        self.author.save()
+        self.assertEqual(self.liked(), [('renamed', 'writer', 2)])
+
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        admin_client = APIClient()
+        admin_client.force_login(admin_user)
+        changelist = reverse('admin:bbprojects_snippet_changelist')
+        for action, expected in (('make_private', []), ('make_public', [('renamed', 'writer', 2)])):
+            admin_client.post(changelist, {'action': action, '_selected_action': [self.snippet.pk]})
+            self.assertEqual(self.liked(), expected)
+
+    def test_evicted_versions_do_not_bring_back_old_feeds(self):
+        self.assertEqual(self.liked(), [('first', 'author', 1)])
+        # A write that sends no signals, then the versions fall out of the cache
+        Snippet.objects.filter(pk=self.snippet.pk).update(title='changed')
+        cache.delete_many([f'activity-feed-version:{self.reader.pk}', f'activity-feed-snippet:{self.snippet.pk}'])
+        self.assertEqual(self.liked(), [('changed', 'author', 1)])
+
+@override_settings(BACKGROUND_TASKS=QUEUED)
+class TaskQueueTests(TestCase):
+    """Tasks are stored with the enqueuing transaction, batched per name and retried."""
+
+    def setUp(self):
+        self.calls = []
+        REGISTRY['test_batch'] = (self.calls.append, True)
+        self.addCleanup(REGISTRY.pop, 'test_batch')
+        self.owner = User.objects.create(username='owner', email='owner@example.com')
+        run_pending()
+
+    def test_tasks_roll_back_with_the_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue('test_batch', {'n': 1})
+            raise RuntimeError
+        self.assertFalse(Task.objects.exists())
+
+    def test_same_name_tasks_run_as_one_batch(self):
+        for n in range(3):
+            enqueue('test_batch', {'n': n})
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(self.calls, [[{'n': 0}, {'n': 1}, {'n': 2}]])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_are_retried_then_kept_as_failed(self):
+        def fail(payloads):
+            raise ValueError('boom')
+        REGISTRY['test_batch'] = (fail, True)
+        enqueue('test_batch')
+        with self.assertLogs('bbprojects.tasks', 'ERROR'):
+            run_pending()
+            run_pending()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertIn('ValueError: boom', task.last_error)
+
+    def test_counters_are_refreshed_by_the_worker(self):
+        snippet = Snippet.objects.create(title='queued', code_content='x', language='python', owner=self.owner)
+        collection = Collection.objects.create(name='queued', owner=self.owner)
+        collection.snippets.add(snippet)
+        self.assertEqual(Collection.objects.get().snippet_count, 0)
+        run_pending()
+        self.assertEqual(Collection.objects.get().snippet_count, 1)
+
+    def test_likes_count_moves_with_each_like(self):
+        snippet = Snippet.objects.create(title='liked', code_content='x', language='python', owner=self.owner)
+        other = User.objects.create(username='other', email='other@example.com')
+        snippet.likes.add(self.owner, other)
+        self.assertEqual(Snippet.objects.get().likes_count, 2)
+        other.liked_snippets.remove(snippet)
+        self.assertEqual(Snippet.objects.get().likes_count, 1)
+        snippet.likes.clear()
+        self.assertEqual(Snippet.objects.get().likes_count, 0)
+        self.assertFalse(Task.objects.filter(name='refresh_likes_count').exists())
+
+    @override_settings(BACKGROUND_TASKS={**QUEUED, 'EAGER': True})
+    def test_eager_tasks_run_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('test_batch', {'n': 1})
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [[{'n': 1}]])
+        self.assertFalse(Task.objects.exists())
+
+@override_settings(SYNC_CHANGES={'SETTLE_SECONDS': 0})
+class SyncChangesTests(TestCase):
+    """/sync/changes returns what changed since a token, as current data or deletions."""
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', email='owner@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = reverse('sync-changes')
+
+    def poll(self, since, client=None):
+        response = (client or self.client).get(self.url, {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_since_a_token(self):
+        token = self.client.get(self.url).json()['next']
+        snippet = Snippet.objects.create(title='a', code_content='x', language='python', owner=self.owner)
+        hidden = Snippet.objects.create(title='b', code_content='x', language='python', owner=self.owner, is_public=False)
+        page = self.poll(token)
+        self.assertEqual(
+            [(change['op'], change['id'], change['data']['title']) for change in page['changes']],
+            [('upsert', snippet.pk, 'a'), ('upsert', hidden.pk, 'b')],
+        )
+        anonymous = self.poll(token, APIClient())
+        self.assertEqual([(change['op'], change['id']) for change in anonymous['changes']],
+                         [('upsert', snippet.pk), ('delete', hidden.pk)])
+
+        snippet_id = snippet.pk
+        snippet.delete()
+        self.assertEqual([(change['op'], change['id']) for change in self.poll(page['next'])['changes']],
+                         [('delete', snippet_id)])
+
+    def test_expired_tokens_get_gone(self):
+        for title in 'abc':
+            Snippet.objects.create(title=title, code_content='x', language='python', owner=self.owner)
+        horizon = Change.objects.order_by('-seq').values_list('seq', flat=True).first()
+        call_command('purge_changes', days=0, stdout=StringIO())
+        self.assertEqual(self.client.get(self.url, {'since': horizon - 2}).status_code, 410)
+        self.assertEqual(self.poll(horizon)['changes'], [])
+
+LIVE = {'BACKEND': 'bbprojects.live.LocalBackend', 'DEBOUNCE_SECONDS': 0, 'HEARTBEAT_SECONDS': 60}
+
+class LiveSubscriptionTests(TestCase):
+    """Subscriptions keep the latest update per id and hide what the user may not see."""
+
+    def update(self, pk, likes_count, is_public=True, owner_id=1):
+        topic = (Change.SNIPPET, pk)
+        return topic, topic, {'type': Change.SNIPPET, 'id': pk, 'likes_count': likes_count}, is_public, owner_id
+
+    def test_updates_are_coalesced_and_debounced_per_id(self):
+        subscription = Subscription(user_id=1, topics={(Change.SNIPPET, 1), (Change.SNIPPET, 2)})
+        subscription.push(*self.update(1, 1))
+        subscription.push(*self.update(1, 2))
+        self.assertEqual([payload['likes_count'] for payload in subscription.take_due(100, 1)], [2])
+
+        subscription.push(*self.update(1, 3))
+        subscription.push(*self.update(2, 7))
+        # Snippet 1 was sent at 100, so it waits out its window; snippet 2 doesn't
+        self.assertEqual([payload['id'] for payload in subscription.take_due(100.5, 1)], [2])
+        self.assertEqual([payload['likes_count'] for payload in subscription.take_due(101, 1)], [3])
+
+    def test_private_objects_of_others_come_through_as_deletions(self):
+        subscription = Subscription(user_id=2, topics={(Change.SNIPPET, 1)})
+        subscription.push(*self.update(1, 5, is_public=False, owner_id=1))
+        self.assertEqual(subscription.take_due(0, 1), [{'type': Change.SNIPPET, 'id': 1, 'deleted': True}])
+
+@override_settings(LIVE_UPDATES=LIVE)
+class LiveUpdatesAppTests(TransactionTestCase):
+    """/api/live streams current counts, then updates published to the hub."""
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', email='owner@example.com')
+        self.snippet = Snippet.objects.create(title='live', code_content='x', language='python', owner=self.owner)
+        self.app = LiveUpdatesApp(None)
+
+    def call(self, query, on_frame):
+        """
+        Run the app, calling ``on_frame(body so far)`` after every frame until it
+        returns True, then disconnect. Returns the status and the body.
+        """
+        async def run():
+            messages, disconnect = [], asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if message['type'] == 'http.response.body' and await on_frame(body()):
+                    disconnect.set()
+
+            def body():
+                return b''.join(message['body'] for message in messages[1:])
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/api/live', 'query_string': query,
+                     'headers': [(b'host', b'localhost')]}
+            await asyncio.wait_for(self.app(scope, receive, send), 5)
+            self.assertEqual(get_hub().connections, 0)
+            return messages[0]['status'], body()
+
+        return async_to_sync(run)()
+
+    def test_stream_sends_snapshot_then_updates(self):
+        def like():
+            self.snippet.likes.add(self.snippet.owner)
+            Snippet.objects.filter(pk=self.snippet.pk).refresh_likes_count()
+
+        async def on_frame(body):
+            if body.count(b'event: update') == 1:
+                await sync_to_async(like)()
+                get_hub().backend.publish([(Change.SNIPPET, self.snippet.pk, None, False)])
+            return body.count(b'event: update') == 2
+
+        status, body = self.call(f'snippets={self.snippet.pk}'.encode(), on_frame)
+        self.assertEqual(status, 200)
+        self.assertEqual(body.split(b'\n\n')[1:3], [
+            b'event: update\ndata: [{"type":"snippet","id":%d,"likes_count":0}]' % self.snippet.pk,
+            b'event: update\ndata: [{"type":"snippet","id":%d,"likes_count":1}]' % self.snippet.pk,
+        ])
+
+    def test_invalid_ids_are_rejected(self):
+        async def on_frame(body):
+            return True
+
+        status, body = self.call(b'snippets=x', on_frame)
+        self.assertEqual(status, 400)
+        self.assertIn(b'snippets', body)
+
+    def test_streams_authenticate_with_a_query_token(self):
+        Snippet.objects.filter(pk=self.snippet.pk).update(is_public=False)
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        token = client.post(reverse('live-token')).json()['token']
+
+        async def on_frame(body):
+            return b'event: update' in body
+
+        snapshot = b'event: update\ndata: [{"type":"snippet","id":%d,%s}]'
+        _, body = self.call(f'snippets={self.snippet.pk}'.encode(), on_frame)
+        self.assertIn(snapshot % (self.snippet.pk, b'"deleted":true'), body)
+        _, body = self.call(f'snippets={self.snippet.pk}&token={token}'.encode(), on_frame)
+        self.assertIn(snapshot % (self.snippet.pk, b'"likes_count":0'), body)
+        status, _ = self.call(f'snippets={self.snippet.pk}&token={token}x'.encode(), on_frame)
+        self.assertEqual(status, 401)
+
+    def test_stream_failures_are_logged(self):
+        async def on_frame(body):
+            if b'event: update' in body:
+                raise ConnectionResetError
+            return False
+
+        with self.assertLogs('bbprojects.live', 'ERROR') as logs:
+            self.call(f'snippets={self.snippet.pk}'.encode(), on_frame)
+        self.assertIn('ConnectionResetError', logs.output[0])
+
+@override_settings(SYNC_CHANGES={'SETTLE_SECONDS': 0}, LIVE_UPDATES={'POLL_INTERVAL': 0.01, 'DB_THREADS': 1})
+class ChangeLogBackendTests(TransactionTestCase):
+    """The default live backend polls the Change table from where it started."""
+
+    def test_changes_recorded_after_it_started_are_read(self):
+        Change.objects.record(Change.SNIPPET, [1])
+
+        def record():
+            Change.objects.record(Change.SNIPPET, [2])
+            Change.objects.record(Change.MEMBERSHIP, [(3, 2)], deleted=True)
+
+        async def run():
+            backend = ChangeLogBackend()
+            hub = Hub(backend)
+            changes = backend.changes(hub)
+            try:
+                first = asyncio.ensure_future(anext(changes))
+                # Let it take its starting point on the hub's one thread
+                await asyncio.sleep(0)
+                await hub.run_sync(record)
+                return await asyncio.wait_for(first, 5)
+            finally:
+                await changes.aclose()
+                hub.executor.shutdown()
+
+        self.assertEqual(async_to_sync(run)(), [(Change.SNIPPET, 2, None, False), (Change.MEMBERSHIP, 3, 2, True)])
+
+class CodeBlobTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='alice')
+
+    def test_snippets_without_code_get_an_empty_body(self):
+        snippet = Snippet.objects.create(title='empty', language='python', owner=self.owner)
+        self.assertEqual(Snippet.objects.get(pk=snippet.pk).code_content, '')
+
+    def test_recently_stored_blobs_are_not_purged(self):
+        blob = CodeBlob.objects.store('print(1)')
+        self.assertFalse(CodeBlob.objects.unreferenced().exists())
+        # Storing an old body again restarts its grace period
+        CodeBlob.objects.filter(pk=blob.pk).update(stored_at=timezone.now() - timedelta(days=1))
+        self.assertTrue(CodeBlob.objects.unreferenced().exists())
+        CodeBlob.objects.store('print(1)')
+        self.assertFalse(CodeBlob.objects.unreferenced().exists())
+        with override_settings(CODE_BLOBS={'PURGE_GRACE_SECONDS': 0}):
+            call_command('purge_code_blobs', stdout=StringIO())
+        self.assertFalse(CodeBlob.objects.exists())
+
+@override_settings(BACKGROUND_TASKS={'EAGER': True})
+class EagerPurgeTests(TransactionTestCase):
+    def test_purges_run_on_a_thread_when_there_is_no_worker(self):
+        owner = User.objects.create(username='owner', email='owner@example.com')
+        snippet = Snippet.objects.create(title='gone', code_content='x', language='python', owner=owner)
+        soft_delete(snippet)
+        thread = _drainer['thread']
+        if thread is not None:
+            thread.join(5)
+        self.assertFalse(Snippet.all_objects.filter(pk=snippet.pk).exists())
+        self.assertFalse(Task.objects.exists())
+
+class SoftDeleteTests(TestCase):
+    """Deleted users, snippets and collections vanish at once and are purged in batches."""
+
+    def setUp(self):
+        self.alice = User.objects.create(username='alice', email='alice@example.com')
+        self.bob = User.objects.create(username='bob', email='bob@example.com')
+        self.client = APIClient()
+
+    def snippet(self, owner, title, code='x'):
+        return Snippet.objects.create(title=title, code_content=code, language='python', owner=owner)
+
+    def test_deleted_user_is_hidden_then_purged_with_counters_kept(self):
+        liked = self.snippet(self.bob, 'liked')
+        own = self.snippet(self.alice, 'own', code='only alice')
+        collection = Collection.objects.create(name='bob', owner=self.bob)
+        collection.snippets.add(liked, own)
+        liked.likes.add(self.alice, self.bob)
+        with override_settings(BACKGROUND_TASKS={'EAGER': False}):
+            self.client.force_authenticate(self.alice)
+            self.assertEqual(self.client.delete(reverse('user-detail', args=[self.alice.pk])).status_code, 204)
+        self.assertFalse(User.objects.filter(pk=self.alice.pk).exists())
+        self.assertFalse(Snippet.objects.filter(pk=own.pk).exists())
+        self.assertEqual(list(collection.snippets.all()), [liked])
+
+        with override_settings(CODE_BLOBS={'PURGE_GRACE_SECONDS': 0}):
+            run_pending(batch_size=1)
+        self.assertFalse(User.all_objects.filter(pk=self.alice.pk).exists())
+        self.assertFalse(Snippet.all_objects.filter(pk=own.pk).exists())
+        self.assertEqual(Snippet.objects.get(pk=liked.pk).likes_count, 1)
+        self.assertEqual(Collection.objects.get(pk=collection.pk).snippet_count, 1)
+        self.assertFalse(CodeBlob.objects.filter(snippets__isnull=True).exists())
+
+    @override_settings(BACKGROUND_TASKS={'EAGER': True})
+    def test_purges_are_queued_even_when_tasks_run_eagerly(self):
+        snippet = self.snippet(self.alice, 'gone')
+        with self.captureOnCommitCallbacks() as callbacks:
+            soft_delete(snippet)
+        self.assertTrue(Snippet.all_objects.filter(pk=snippet.pk).exists())
+        self.assertEqual(Task.objects.get().payload, {'model': 'snippet', 'id': snippet.pk})
+        # Run off the request by a thread, as no worker is expected
+        self.assertIn(drain_in_background, callbacks)
+
+    @override_settings(BACKGROUND_TASKS={'EAGER': False})
+    def test_deleted_snippets_leave_collection_counts(self):
+        collection = Collection.objects.create(name='bob', owner=self.bob)
+        kept, gone = self.snippet(self.alice, 'kept'), self.snippet(self.alice, 'gone')
+        collection.snippets.add(kept, gone)
+        run_pending()
+        self.assertEqual(Collection.objects.get().snippet_count, 2)
+        soft_delete(gone)
+        self.assertEqual(
+            set(Task.objects.values_list('name', flat=True)), {'refresh_snippet_count', 'purge_deleted'}
+        )
+        run_pending()
+        self.assertEqual(Collection.objects.get().snippet_count, 1)
+
+    def test_deleted_users_free_their_username_and_email(self):
+        soft_delete(self.alice)
+        response = self.client.post(reverse('rest_register'), {
+            'username': 'alice', 'email': 'alice@example.com',
+            'password1': 'a-long-passphrase', 'password2': 'a-long-passphrase',
+        }, SERVER_NAME='localhost')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(User.objects.get(username='alice').email, 'alice@example.com')
+        self.assertEqual(User.all_objects.get(pk=self.alice.pk).username, f'deleted:{self.alice.pk}')
+
+    def test_purge_memory_stays_flat(self):
+        likes = 100_000
+        blob = CodeBlob.objects.store('x')
+        Snippet.objects.bulk_create(
+            [Snippet(title=f's{i}', code_blob=blob, language='python', owner=self.bob) for i in range(likes)],
+            batch_size=5000,
+        )
+        Like = Snippet.likes.through
+        Like.objects.bulk_create(
+            [Like(snippet_id=pk, user_id=self.alice.pk) for pk in Snippet.objects.values_list('pk', flat=True)],
+            batch_size=5000,
+        )
+        Snippet.objects.refresh_likes_count()
+        self.assertEqual(Snippet.objects.filter(likes_count=1).count(), likes)
+        soft_delete(self.alice)
+
+        tracemalloc.start()
+        try:
+            self.assertTrue(purge('user', self.alice.pk, batch_size=1000))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # A batch at a time; the collector would hold all 100k likes at once
+        self.assertLess(peak, 4 * 1024 * 1024)
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Snippet.objects.filter(likes_count__gt=0).exists())
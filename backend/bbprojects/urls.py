@@ -1,21 +1,27 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
 
-router = DefaultRouter()
-router.register(r'users', views.UserViewSet, basename='user')
-router.register(r'snippets', views.SnippetViewSet)
-router.register(r'collections', views.CollectionViewSet)
+# In the ASGI deployment mode the read endpoints are served by async viewsets
+if settings.ASYNC_READ_VIEWS:
+    from . import asyncviews as viewsets
+else:
+    viewsets = views
 
-# Print registered URLs for debugging
-print("Available endpoints:")
-for url in router.urls:
-    print(f"- {url.pattern}")
+router = DefaultRouter()
+router.register(r'users', viewsets.UserViewSet, basename='user')
+router.register(r'snippets', viewsets.SnippetViewSet)
+router.register(r'collections', viewsets.CollectionViewSet)
 
 urlpatterns = [
     path('auth/', include('dj_rest_auth.urls')),
     path('auth/registration/', include('dj_rest_auth.registration.urls')),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('_metrics', views.metrics, name='metrics'),
+    path('search/suggest', views.search_suggest, name='search-suggest'),
+    path('sync/changes', views.sync_changes, name='sync-changes'),
+    path('live/token', views.live_token, name='live-token'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
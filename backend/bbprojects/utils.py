@@ -1,3 +1,4 @@
+import math
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -17,4 +18,11 @@ def error_response(message, status_code=status.HTTP_400_BAD_REQUEST):
         message=message,
         success=False,
         status_code=status_code
-    ) 
\ No newline at end of file
+    ) 
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
@@ -1,13 +1,15 @@
-from django.shortcuts import render
+import logging
 from rest_framework import viewsets, permissions, status, filters, serializers
 from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
 from django.db import models
+from django.http import HttpResponse
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from .models import Snippet, User, Collection
-from .serializers import SnippetSerializer, UserSerializer, CollectionSerializer
+from .serializers import SnippetSerializer, UserSerializer, CollectionSerializer, SNIPPET_ROWS, USER_ROWS
 from .permissions import IsOwnerOrReadOnly, IsUserOrReadOnly, IsPublicOrIsOwner
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import SnippetFilter, CollectionFilter
@@ -25,24 +27,74 @@ from .validators import (
     SnippetActionSerializer
 )
 from .throttling import SnippetCreateThrottle, CollectionCreateThrottle
+from .feeds import parse_feed_params, get_activity_feed
+from .suggest import SOURCES, suggest_settings, get_suggestions
+from .sync import parse_sync_params, current_token, get_changes
+from .live import live_settings, stream_token
+from .deletion import soft_delete
+from .instrumentation import metrics as route_metrics, timed
 
-class UserViewSet(viewsets.ModelViewSet):
+logger = logging.getLogger(__name__)
+
+class ValuesListMixin:
+    """
+    Serve ``list`` from ``.values()`` rows turned into dicts by ``row_mapper``,
+    skipping model instances and serializer fields. Falls back to the
+    serializer when there is no mapper, the fast path is switched off
+    (FAST_LIST_SERIALIZATION) or the page is ordered by a column the rows
+    don't carry.
+    """
+
+    row_mapper = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page, data = self.list_page(queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def list_page(self, queryset):
+        """``(page, data)`` for a list response; ``page`` is None when unpaginated."""
+        if self.use_rows(queryset):
+            queryset = queryset.values(*self.row_mapper.columns)
+            page = self.paginate_queryset(queryset)
+            with timed(self.request, 'serialize'):
+                return page, self.row_mapper.map(queryset if page is None else page)
+        page = self.paginate_queryset(queryset)
+        with timed(self.request, 'serialize'):
+            return page, self.get_serializer(queryset if page is None else page, many=True).data
+
+    def use_rows(self, queryset):
+        if self.row_mapper is None or not settings.FAST_LIST_SERIALIZATION:
+            return False
+        # Cursor pagination reads its position from the ordering column
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        if get_ordering is None:
+            return True
+        ordering = get_ordering(self.request, queryset, self)
+        return all(field.lstrip('-') in self.row_mapper.columns for field in ordering)
+
+class UserViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsUserOrReadOnly]
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['username', 'location']
     pagination_class = StandardResultsSetPagination
+    row_mapper = USER_ROWS
 
     def get_queryset(self):
         if not self.request.user.is_authenticated:
             return User.objects.filter(is_public=True)
         return User.objects.all()
 
+    def perform_destroy(self, instance):
+        soft_delete(instance)
+
     @action(detail=False, methods=['get', 'patch'], permission_classes=[permissions.IsAuthenticated])
     def me(self, request):
         """Get or update the authenticated user's profile."""
-        print("Me endpoint called!")  # Debug print
         if request.method == 'GET':
             serializer = self.get_serializer(request.user)
             return Response(serializer.data)
@@ -57,20 +109,18 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='me/stats', permission_classes=[permissions.IsAuthenticated])
     def stats(self, request):
         """Get the authenticated user's stats."""
-        print("Stats endpoint called!")  # Debug print
         try:
-            print(f"Getting stats for user: {request.user.username}")
             user = request.user
             stats = {
                 'snippets_count': user.snippets.count(),
                 'collections_count': user.collections.count(),
-                'likes_received': sum(snippet.likes.count() for snippet in user.snippets.all()),
+                'likes_received': Snippet.likes.through.objects.filter(snippet__owner=user).count(),
                 'likes_given': user.liked_snippets.count() if hasattr(user, 'liked_snippets') else 0,
             }
-            print(f"Stats calculated: {stats}")  # Debug print
+            logger.debug("Stats for user %s: %s", user.pk, stats)
             return Response(stats)
-        except Exception as e:
-            print(f"Error in stats: {str(e)}")  # Debug print
+        except Exception:
+            logger.exception("Failed to get stats for user %s", request.user.pk)
             return Response(
                 {"error": "Failed to get user stats"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -78,28 +128,23 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='me/activity', permission_classes=[permissions.IsAuthenticated])
     def activity(self, request):
-        """Get the authenticated user's recent activity."""
-        print("Activity endpoint called!")  # Debug print
-        try:
-            print(f"Getting activity for user: {request.user.username}")
-            user = request.user
-            recent_snippets = user.snippets.order_by('-created_at')[:5]
-            recent_collections = user.collections.order_by('-created_at')[:5]
+        """
+        Get the authenticated user's activity feed.
 
-            activity_data = {
-                'recent_snippets': SnippetSerializer(recent_snippets, many=True).data,
-                'recent_collections': CollectionSerializer(recent_collections, many=True).data,
-            }
-            print(f"Activity data prepared: {activity_data}")  # Debug print
-            return Response(activity_data)
-        except Exception as e:
-            print(f"Error in activity: {str(e)}")  # Debug print
+        ``?kinds=`` picks sections (snippets, collections, likes_given,
+        likes_received) and ``?limit=`` caps the items per section.
+        """
+        kinds, limit = parse_feed_params(request.query_params)
+        try:
+            return Response(get_activity_feed(request, kinds, limit))
+        except Exception:
+            logger.exception("Failed to get activity for user %s", request.user.pk)
             return Response(
                 {"error": "Failed to get user activity"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class SnippetViewSet(viewsets.ModelViewSet):
+class SnippetViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Snippet.objects.all()
     serializer_class = SnippetSerializer
     permission_classes = [
@@ -115,9 +160,10 @@ class SnippetViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'likes', 'title']
     ordering = ['-created_at']
     pagination_class = CursorSetPagination
+    row_mapper = SNIPPET_ROWS
 
     def get_queryset(self):
-        queryset = Snippet.objects.all()
+        queryset = Snippet.objects.select_related('owner', 'code_blob').with_like_info(self.request.user)
         
         # Filter by language
         language = self.request.query_params.get('language', None)
@@ -138,6 +184,10 @@ class SnippetViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def perform_destroy(self, instance):
+        # Hidden now; likes, memberships and the row itself go in batches
+        soft_delete(instance)
+
     def create(self, request, *args, **kwargs):
         try:
             # Validate request data
@@ -197,11 +247,12 @@ class SnippetViewSet(viewsets.ModelViewSet):
             else:
                 snippet.likes.add(request.user)
                 is_liked = True
+            snippet.refresh_from_db(fields=['likes_count'])
                 
             return Response({
                 'data': {
                     'is_liked': is_liked,
-                    'likes_count': snippet.likes.count()
+                    'likes_count': snippet.likes_count
                 }
             }, status=status.HTTP_200_OK)
         except Exception as e:
@@ -214,7 +265,7 @@ class SnippetViewSet(viewsets.ModelViewSet):
             return [SnippetCreateThrottle()]
         return super().get_throttles()
 
-class CollectionViewSet(viewsets.ModelViewSet):
+class CollectionViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
@@ -223,13 +274,17 @@ class CollectionViewSet(viewsets.ModelViewSet):
                       filters.OrderingFilter]
     filterset_class = CollectionFilter
     search_fields = ['name', 'description']
-    ordering_fields = ['created_at', 'name']
+    ordering_fields = ['created_at', 'name', 'snippet_count']
     ordering = ['-created_at']
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        queryset = Collection.objects.all()
-        
+        queryset = Collection.objects.select_related('owner')
+
+        # Only the read actions serialize the nested snippets
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.prefetch_related(self.snippets_prefetch())
+
         if self.request.user.is_authenticated:
             return queryset.filter(
                 models.Q(is_public=True) | 
@@ -237,9 +292,28 @@ class CollectionViewSet(viewsets.ModelViewSet):
             )
         return queryset.filter(is_public=True)
 
+    def snippets_prefetch(self):
+        return models.Prefetch(
+            'snippets',
+            queryset=Snippet.objects.select_related('owner', 'code_blob').with_like_info(self.request.user)
+        )
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def perform_destroy(self, instance):
+        soft_delete(instance)
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        # The response nests the snippets; load them once, after the save
+        models.prefetch_related_objects([instance], self.snippets_prefetch())
+        return Response(serializer.data)
+
     def create(self, request, *args, **kwargs):
         try:
             # Validate request data
@@ -357,4 +431,72 @@ def reset_password(request):
             status_code=status.HTTP_200_OK
         )
     except Exception as e:
-        return error_response(str(e))
\ No newline at end of file
+        return error_response(str(e))
+
+def parse_suggest_params(query_params):
+    """Validate the ``q``, ``types`` and ``limit`` query parameters of the typeahead."""
+    conf = suggest_settings()
+
+    query = query_params.get('q', '')
+    if not query.strip():
+        raise serializers.ValidationError({'q': 'This parameter is required.'})
+
+    types = query_params.get('types')
+    types = [t for t in types.split(',') if t] if types else list(SOURCES)
+    unknown = [t for t in types if t not in SOURCES]
+    if unknown:
+        raise serializers.ValidationError(
+            {'types': f"Unknown types: {', '.join(unknown)}. Choose from {', '.join(SOURCES)}."}
+        )
+
+    try:
+        limit = int(query_params.get('limit', conf['DEFAULT_LIMIT']))
+    except ValueError:
+        raise serializers.ValidationError({'limit': 'A valid integer is required.'})
+    if not 1 <= limit <= conf['MAX_LIMIT']:
+        raise serializers.ValidationError({'limit': f"Must be between 1 and {conf['MAX_LIMIT']}."})
+
+    return query, sorted(set(types), key=list(SOURCES).index), limit
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_suggest(request):
+    """
+    Typeahead: users, collections and snippets whose name starts with ``?q=``
+    (case and accents ignored), public ones plus the caller's own.
+    ``?types=`` restricts the kinds and ``?limit=`` caps the results.
+    """
+    query, types, limit = parse_suggest_params(request.query_params)
+    return Response({'query': query, 'results': get_suggestions(request.user, query, types, limit)})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def sync_changes(request):
+    """
+    Snippets, collections, memberships and the caller's likes changed since
+    ``?since=<token>``, plus the ``next`` token to poll with. Without
+    ``since`` only the current token is returned: take it, then fetch the
+    full lists. 410 means the token predates the retained change log.
+    """
+    since, limit = parse_sync_params(request.query_params)
+    if since is None:
+        return Response({'changes': [], 'next': current_token(), 'has_more': False})
+    return Response(get_changes(request, since, limit))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def live_token(request):
+    """
+    A short-lived ``token`` for ``/api/live?token=``. EventSource sends no
+    Authorization header, so cross-origin clients open streams with it.
+    """
+    return Response({'token': stream_token(request.user), 'expires_in': live_settings()['TOKEN_MAX_AGE']})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Per-route latency and query histograms of this process, in Prometheus text format."""
+    return HttpResponse(
+        route_metrics.prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
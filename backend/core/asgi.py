@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up; /api/live streams are answered before
+# Django's request handling, everything else goes to Django
+from bbprojects.live import LiveUpdatesApp  # noqa: E402
+
+application = LiveUpdatesApp(django_application)
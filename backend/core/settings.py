@@ -40,9 +40,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bbprojects.instrumentation.PerformanceMiddleware',
+    'bbprojects.log.RequestLogMiddleware',
+    'bbprojects.db_routers.ReplicaRoutingMiddleware',
+    'bbprojects.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'bbprojects.static.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,24 +75,216 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+
+# Serve the read endpoints from async viewsets (ASGI deployment mode, see README)
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+# Threads (and database connections) per process for queries run side by
+# side, as in the async stats and activity endpoints
+READ_THREADS = int(os.environ.get('READ_THREADS', '4'))
+
+# Build list pages from .values() rows instead of model instances and serializers
+FAST_LIST_SERIALIZATION = os.environ.get('FAST_LIST_SERIALIZATION', '1').lower() in ('1', 'true', 'yes')
+
+# Run on every new SQLite connection. WAL lets readers run alongside a
+# writer; synchronous=NORMAL is durable across application crashes and only
+# skips fsyncs that matter on power loss.
+SQLITE_INIT_COMMAND = ';'.join([
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -20000',  # KiB
+    'PRAGMA mmap_size = 134217728',
+])
 
 # Database
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '500')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a writer waits for the database lock before failing
+            'timeout': 20,
+            # Take the write lock when the transaction starts, so concurrent
+            # writers queue on the timeout instead of failing with "locked"
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': SQLITE_INIT_COMMAND,
+        },
     }
 }
 
-# Database configuration for Heroku
+# Database configuration for Heroku / Postgres.
+# DB_POOL_SIZE > 0 enables psycopg 3's connection pool with that many
+# connections per worker process (gunicorn workers * DB_POOL_SIZE must fit
+# the server's max_connections). Otherwise connections persist for
+# DB_CONN_MAX_AGE seconds and are health-checked before reuse.
 DATABASE_URL = os.environ.get('DATABASE_URL')
-if DATABASE_URL:
-    db_from_env = dj_database_url.config(
-        default=DATABASE_URL,
-        conn_max_age=500,
-        ssl_require=True
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '0'))
+
+def database_from_url(url):
+    config = dj_database_url.parse(
+        url,
+        conn_max_age=0 if DB_POOL_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', '500')),
+        conn_health_checks=True,
+        ssl_require=url.startswith('postgres') and
+        os.environ.get('DATABASE_SSL_REQUIRE', '1').lower() in ('1', 'true', 'yes'),
     )
-    DATABASES['default'].update(db_from_env)
+    if url.startswith('sqlite'):
+        config.setdefault('OPTIONS', {})['init_command'] = SQLITE_INIT_COMMAND
+    if DB_POOL_SIZE and url.startswith('postgres'):
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': min(int(os.environ.get('DB_POOL_MIN_SIZE', '1')), DB_POOL_SIZE),
+            'max_size': DB_POOL_SIZE,
+            # Seconds a request waits for a free connection before erroring
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            # Recycle connections before server-side idle timeouts kill them
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        }
+    return config
+
+if DATABASE_URL:
+    DATABASES['default'] = database_from_url(DATABASE_URL)
+
+# Read replicas: comma separated URLs, registered as replica_1, replica_2, ...
+# Safe-method requests read from a random replica unless the user wrote in
+# the last REPLICA_PIN_SECONDS (see bbprojects.db_routers); the pins need a
+# shared cache (REDIS_URL). Locally, two SQLite files work as stand-ins:
+# DATABASE_REPLICA_URLS=sqlite:////abs/path/replica.sqlite3
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica_{index}'] = {**database_from_url(url), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['bbprojects.db_routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
+# Caches. The local-memory cache is per process; point REDIS_URL at a shared
+# Redis so cache invalidation reaches every gunicorn worker.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if REDIS_URL:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+# /api/users/me/activity/ feed
+ACTIVITY_FEED = {
+    'DEFAULT_KINDS': ['snippets', 'collections'],
+    'DEFAULT_LIMIT': 5,
+    'MAX_LIMIT': 50,
+    # Build the feed sections at the same time, each on its own DB connection
+    'CONCURRENT': os.environ.get('ACTIVITY_FEED_CONCURRENT', '').lower() in ('1', 'true', 'yes'),
+    'CACHE_TIMEOUT': 60,
+}
+
+# /api/search/suggest typeahead
+SEARCH_SUGGEST = {
+    'DEFAULT_LIMIT': 8,
+    'MAX_LIMIT': 20,
+    'CACHE_TIMEOUT': 300,
+    'BUCKET_LENGTH': 1,
+}
+
+# /api/sync/changes change log; clients whose token is older than the
+# retention get a 410 and must fetch the full lists again
+SYNC_CHANGES = {
+    'RETENTION_DAYS': int(os.environ.get('SYNC_RETENTION_DAYS', '30')),
+    'DEFAULT_LIMIT': 500,
+    'MAX_LIMIT': 2000,
+    # Longer than any transaction that records changes is expected to stay
+    # open; see SYNC_DEFAULTS in bbprojects.sync
+    'SETTLE_SECONDS': int(os.environ.get('SYNC_SETTLE_SECONDS', '2')),
+}
+
+# GET /api/live Server-Sent Events, served by core.asgi only. BACKEND feeds
+# the per-worker hub; the default polls the sync change log.
+LIVE_UPDATES = {
+    'BACKEND': 'bbprojects.live.ChangeLogBackend',
+    'POLL_INTERVAL': 1.0,
+    'DEBOUNCE_SECONDS': 1.0,
+    'HEARTBEAT_SECONDS': 15,
+    'MAX_IDS': 200,
+    'MAX_CONNECTIONS': int(os.environ.get('LIVE_MAX_CONNECTIONS', '5000')),
+    'RETRY_MS': 5000,
+    'DB_THREADS': 2,
+    'TOKEN_MAX_AGE': 60,
+}
+
+# Deferred work (counter refreshes, typeahead updates) from bbprojects.tasks.
+# Eager runs each task in-process right after the enqueuing transaction
+# commits; otherwise tasks are queued in the database for manage.py run_worker.
+# Production queues them for the Procfile's worker; development runs them eagerly.
+BACKGROUND_TASKS = {
+    'EAGER': os.environ.get('BACKGROUND_TASKS_EAGER', '1' if DEBUG else '0').lower() in ('1', 'true', 'yes'),
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 2,
+    'BACKOFF_MAX': 600,
+    'LEASE_SECONDS': 300,
+    'BATCH_SIZE': 100,
+}
+
+# Deleting users, snippets and collections: hidden at once, then purged by
+# the purge_deleted task in batches (bbprojects.deletion)
+DELETION = {
+    'BATCH_SIZE': int(os.environ.get('DELETION_BATCH_SIZE', '1000')),
+    'TIME_BUDGET': 30,
+}
+
+# Logging. bbprojects loggers emit one JSON object per line; records are
+# written to stderr from a background thread. Test runs only show warnings
+# (see TEST_RUNNER; use assertLogs to check INFO records).
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'bbprojects.log.JSONFormatter',
+        },
+    },
+    'handlers': {
+        'json': {
+            'class': 'bbprojects.log.QueuedStreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'bbprojects': {
+            'handlers': ['json'],
+            'level': os.environ.get('BBPROJECTS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Per-request log lines (route, status, queries, DB time, latency) for a
+# fraction of requests. 0 disables the middleware entirely.
+REQUEST_LOG = {
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', '0')),
+}
+
+# Per-request query/timing instrumentation: Server-Timing header plus rolling
+# per-route histograms served (admin only) at /api/_metrics. The histograms
+# are per process, so scrape every worker.
+PERF_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('PERF_INSTRUMENTATION', '1').lower() in ('1', 'true', 'yes'),
+    'SERVER_TIMING': True,
+    'WINDOW': 1024,
+}
+
+# Negotiated zstd/brotli/gzip compression of API responses; the codings
+# offered depend on which of zstandard and brotli are installed
+RESPONSE_COMPRESSION = {
+    'ENABLED': os.environ.get('RESPONSE_COMPRESSION', '1').lower() in ('1', 'true', 'yes'),
+    'MIN_SIZE': int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', '1024')),
+}
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -158,6 +354,10 @@ CORS_ALLOW_HEADERS = [
 
 # Django REST Framework settings
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'bbprojects.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'dj_rest_auth.jwt_auth.JWTCookieAuthentication',
     ],
@@ -191,5 +391,5 @@ REST_AUTH = {
     'JWT_AUTH_REFRESH_COOKIE': 'refresh',
     'JWT_AUTH_HTTPONLY': False,
     'USER_DETAILS_SERIALIZER': 'bbprojects.serializers.UserSerializer',
-    'REGISTER_SERIALIZER': 'bbprojects.serializers.CustomRegisterSerializer',
+    'REGISTER_SERIALIZER': 'bbprojects.registration.CustomRegisterSerializer',
 }
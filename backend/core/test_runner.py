@@ -0,0 +1,15 @@
+import logging
+import os
+
+from django.test.runner import DiscoverRunner
+
+class TestRunner(DiscoverRunner):
+    """
+    Only show bbprojects warnings during test runs, unless BBPROJECTS_LOG_LEVEL
+    is set. assertLogs still captures INFO records.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if 'BBPROJECTS_LOG_LEVEL' not in os.environ:
+            logging.getLogger('bbprojects').setLevel(logging.WARNING)
@@ -0,0 +1,41 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn runs from backend/.
+
+With GUNICORN_PRELOAD (the default) the application, URLconf and views are
+imported once in the master and shared with forked workers copy-on-write;
+otherwise each worker imports them itself, before taking its first request.
+"""
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+
+def warm_up():
+    """Import the URLconf and everything it pulls in (views, DRF, serializers)."""
+    from django.urls import reverse
+    reverse('api-root')
+
+def close_connections():
+    # Sockets and pool threads must not be shared with forked children
+    from django.db import connections
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        # Accessing .pool would open a pool that doesn't exist yet
+        if connection.alias in getattr(connection, '_connection_pools', ()):
+            connection.close_pool()
+
+def when_ready(server):
+    if preload_app:
+        warm_up()
+        close_connections()
+        # Keep the warmed-up objects out of the collector, which would
+        # otherwise touch (and un-share) their pages in every worker
+        gc.freeze()
+
+def pre_fork(server, worker):
+    if preload_app:
+        close_connections()
+
+def post_worker_init(worker):
+    if not preload_app:
+        warm_up()